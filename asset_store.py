@@ -0,0 +1,220 @@
+import os
+import re
+from threading import Lock
+
+IMAGE_DIR = 'image/'
+
+# 每个md5对应的文件类别及规范文件名后缀，新写入的文件一律使用规范文件名
+KINDS = {
+	'original': '.jpg',
+	'thumb': '_thumb.jpg',
+	'mask': '_mask.png',
+	'mask_info': '_mask.json',
+	'lama': '_lama.jpg',
+	'lama_thumb': '_lama_thumb.jpg',
+}
+# 以内容md5命名、写入后不会再变化的文件，客户端可以永久缓存；mask和处理结果重新上传或重新处理后会被覆盖
+IMMUTABLE_KINDS = ('original', 'thumb')
+# 可以按需生成预览用缩小版的文件
+RENDITION_KINDS = ('original', 'lama')
+_SUFFIX_KINDS = {'': 'original', '_thumb': 'thumb', '_mask': 'mask', '_lama': 'lama', '_lama_thumb': 'lama_thumb'}
+_FILENAME_RE = re.compile(r'^([0-9a-fA-F]{32})(_thumb|_mask|_lama_thumb|_lama)?\.(jpg|png|gif|json)$')
+
+
+def parse_filename(name):
+	"""解析图片目录中的文件名
+	:return: (md5, 类别)，不是本系统保存的文件时返回 (None, None)
+	"""
+	match = _FILENAME_RE.match(name)
+	if not match:
+		return None, None
+	md5, suffix, ext = match.group(1), match.group(2) or '', match.group(3)
+	if ext == 'json':
+		return (md5, 'mask_info') if suffix == '_mask' else (None, None)
+	return md5, _SUFFIX_KINDS[suffix]
+
+
+class AssetStore:
+	"""记录每个md5已写入文件的路径和大小，查找和删除时直接查字典，不再逐个扩展名探测文件
+	文件按md5前两级前缀分片保存在 image/ab/cd/ 下，避免单个目录中文件过多。
+	首次使用时扫描一次图片目录（兼容旧版本平铺保存的文件和png/gif原图、mask）；之后由写入方调用 record 登记。
+	其他进程（如 process 模式的推理worker）写入的文件不在本进程的索引中，查找未命中时按规范路径检查一次
+	"""
+
+	def __init__(self, image_dir=IMAGE_DIR):
+		self.image_dir = image_dir
+		self.lock = Lock()
+		# {md5: {类别: (路径, 大小)}}
+		self.assets = None
+		# 旧版本留下的同类别其他扩展名文件 {md5: [路径]}，删除任务时一并删除
+		self.extras = {}
+		# 已确认存在的分片目录
+		self.shards = set()
+
+	def _iter_files(self):
+		"""遍历图片目录顶层（旧版本平铺的文件）和两级分片目录中的文件"""
+		for entry in os.scandir(self.image_dir):
+			if entry.is_file():
+				yield entry
+			elif entry.is_dir() and len(entry.name) == 2:
+				for sub in os.scandir(entry.path):
+					if sub.is_dir() and len(sub.name) == 2:
+						self.shards.add(sub.path)
+						yield from (f for f in os.scandir(sub.path) if f.is_file())
+
+	def _load(self):
+		"""扫描图片目录建立索引，需在持有锁时调用"""
+		if self.assets is not None:
+			return
+		self.assets = {}
+		if not os.path.isdir(self.image_dir):
+			return
+		for entry in self._iter_files():
+			md5, kind = parse_filename(entry.name)
+			if md5 is None:
+				continue
+			assets = self.assets.setdefault(md5, {})
+			# 同一类别存在多个扩展名时优先使用规范文件名
+			if kind in assets:
+				if not entry.name.endswith(KINDS[kind]):
+					self.extras.setdefault(md5, []).append(entry.path)
+					continue
+				self.extras.setdefault(md5, []).append(assets[kind][0])
+			assets[kind] = (entry.path, entry.stat().st_size)
+
+	def shard_dir(self, md5):
+		"""md5所在的分片目录 image/ab/cd/"""
+		return os.path.join(self.image_dir, md5[:2], md5[2:4])
+
+	def _canonical(self, md5, kind):
+		return os.path.join(self.shard_dir(md5), f"{md5}{KINDS[kind]}")
+
+	def path(self, md5, kind):
+		"""新写入文件使用的规范路径，分片目录不存在时创建"""
+		shard = self.shard_dir(md5)
+		if shard not in self.shards:
+			os.makedirs(shard, exist_ok=True)
+			self.shards.add(shard)
+		return self._canonical(md5, kind)
+
+	def record(self, md5, kind, path=None, size=None):
+		"""登记已写入的文件
+		:param path: 文件路径，默认为规范路径
+		:param size: 文件大小，未提供时读取一次
+		"""
+		path = path or self._canonical(md5, kind)
+		if size is None:
+			size = os.path.getsize(path)
+		with self.lock:
+			self._load()
+			self.assets.setdefault(md5, {})[kind] = (path, size)
+		return path
+
+	def _lookup(self, md5, kind):
+		with self.lock:
+			self._load()
+			entry = self.assets.get(md5, {}).get(kind)
+		if entry is not None:
+			return entry
+		# 索引中没有时检查一次规范路径，兼容其他进程写入的文件
+		path = self._canonical(md5, kind)
+		try:
+			size = os.path.getsize(path)
+		except OSError:
+			return None
+		self.record(md5, kind, path, size)
+		return path, size
+
+	def find(self, md5, kind):
+		"""查找已存在的文件
+		:return: 文件路径，不存在时返回None
+		"""
+		entry = self._lookup(md5, kind)
+		return entry[0] if entry else None
+
+	def size(self, md5, kind):
+		"""文件大小，不存在时返回None"""
+		entry = self._lookup(md5, kind)
+		return entry[1] if entry else None
+
+	def resolve(self, filename):
+		"""把 /image/ 请求中的文件名（如 <md5>_lama.jpg）映射为实际保存的路径
+		:return: 文件路径，不存在时返回None
+		"""
+		md5, kind = parse_filename(filename)
+		if md5 is None:
+			return None
+		return self.find(md5, kind)
+
+	def is_immutable(self, filename):
+		"""/image/ 请求的文件内容是否永远不会变化"""
+		return parse_filename(filename)[1] in IMMUTABLE_KINDS
+
+	def is_renderable(self, filename):
+		"""/image/ 请求的文件是否可以生成缩小版（mask等不适合缩放和有损压缩）"""
+		return parse_filename(filename)[1] in RENDITION_KINDS
+
+	def exists(self, md5, *kinds):
+		"""所有指定类别的文件是否都存在"""
+		return all(self._lookup(md5, kind) for kind in kinds)
+
+	def discard(self, md5, kind):
+		"""删除一个文件及其登记
+		:return: 被删除文件的路径，文件不存在时返回None
+		"""
+		entry = self._lookup(md5, kind)
+		with self.lock:
+			self.assets.get(md5, {}).pop(kind, None)
+		if entry is None:
+			return None
+		try:
+			os.remove(entry[0])
+		except FileNotFoundError:
+			return None
+		return entry[0]
+
+	def delete(self, md5):
+		"""删除md5的所有文件
+		:return: 被删除的文件名列表
+		"""
+		deleted = []
+		for kind in KINDS:
+			try:
+				path = self.discard(md5, kind)
+			except OSError as e:
+				print(f"[WARNING] 删除文件 {md5}{KINDS[kind]} 失败: {str(e)}")
+				continue
+			if path:
+				deleted.append(os.path.basename(path))
+		with self.lock:
+			self.assets.pop(md5, None)
+			extras = self.extras.pop(md5, [])
+		for path in extras:
+			try:
+				os.remove(path)
+				deleted.append(os.path.basename(path))
+			except OSError as e:
+				print(f"[WARNING] 删除文件 {os.path.basename(path)} 失败: {str(e)}")
+		return deleted
+
+	def migrate(self):
+		"""把旧版本平铺在图片目录顶层的文件移动到分片目录，需在服务停止时执行
+		:return: 移动的文件数量
+		"""
+		moved = 0
+		for entry in list(os.scandir(self.image_dir)):
+			md5, _ = parse_filename(entry.name)
+			if md5 is None or not entry.is_file():
+				continue
+			shard = self.shard_dir(md5)
+			os.makedirs(shard, exist_ok=True)
+			os.replace(entry.path, os.path.join(shard, entry.name))
+			moved += 1
+		with self.lock:
+			self.assets = None
+			self.extras = {}
+		return moved
+
+
+# 创建全局文件索引实例
+asset_store = AssetStore()
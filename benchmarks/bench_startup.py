@@ -0,0 +1,117 @@
+"""测量服务的导入耗时和启动耗时
+
+用法（在项目根目录执行）：
+	python benchmarks/bench_startup.py --runs 5 --port 18080 --modes lazy,background,eager
+
+导入耗时：每次在新的子进程中执行 import upload，取 --runs 次的中位数，并检查导入后是否已加载torch；
+同时测量单独 import torch 的耗时作为参照。
+启动耗时：按各 LAMA_STARTUP 方式启动服务，记录从启动进程到开始响应请求、到 /ready 返回200 的时间。
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_CODE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'torch': 'torch' in sys.modules}}))
+'''
+
+
+def measure_import(module, runs):
+	"""在新进程中导入模块 runs 次
+	:return: (耗时中位数, 导入后是否加载了torch)，导入失败时返回None
+	"""
+	results = []
+	for _ in range(runs):
+		proc = subprocess.run([sys.executable, '-c', IMPORT_CODE.format(module=module)], cwd=ROOT, capture_output=True, text=True)
+		lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+		if proc.returncode != 0 or not lines:
+			return None
+		results.append(json.loads(lines[-1]))
+	return statistics.median(r['seconds'] for r in results), results[-1]['torch']
+
+
+def probe(port):
+	"""请求 /ready
+	:return: HTTP状态码，服务尚未响应时返回None
+	"""
+	try:
+		conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+		conn.request('GET', '/ready')
+		status = conn.getresponse().status
+		conn.close()
+		return status
+	except OSError:
+		return None
+
+
+def measure_startup(mode, port, timeout):
+	"""按指定的 LAMA_STARTUP 方式启动服务
+	:return: (开始响应请求的耗时, /ready 返回200的耗时)，超时的项为None
+	"""
+	env = dict(os.environ, LAMA_STARTUP=mode)
+	start = time.perf_counter()
+	proc = subprocess.Popen(
+		[sys.executable, '-c', f'import upload; upload.run(port={port})'],
+		cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+	)
+	serving = ready = None
+	try:
+		while time.perf_counter() - start < timeout and proc.poll() is None:
+			status = probe(port)
+			if status is not None and serving is None:
+				serving = time.perf_counter() - start
+			if status == 200:
+				ready = time.perf_counter() - start
+				break
+			time.sleep(0.05)
+	finally:
+		# 按Ctrl+C的方式停止，服务会正常关闭推理子进程
+		proc.send_signal(signal.SIGINT)
+		try:
+			proc.wait(timeout=15)
+		except subprocess.TimeoutExpired:
+			proc.kill()
+			proc.wait()
+	return serving, ready
+
+
+def fmt(seconds):
+	return f"{seconds:.2f}" if seconds is not None else '-'
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--runs', type=int, default=5, help='导入耗时的测量次数')
+	parser.add_argument('--port', type=int, default=18080, help='启动测试使用的端口')
+	parser.add_argument('--modes', default='lazy,background,eager', help='要测量的 LAMA_STARTUP 方式')
+	parser.add_argument('--timeout', type=float, default=300, help='等待 /ready 的最长时间（秒）')
+	args = parser.parse_args()
+
+	print(f"{'导入':<12}{'耗时(s)':>10}{'已加载torch':>14}")
+	for module in ('upload', 'torch'):
+		result = measure_import(module, args.runs)
+		if result is None:
+			print(f"{module:<12}导入失败")
+			continue
+		print(f"{module:<12}{result[0]:>10.3f}{str(result[1]):>14}")
+
+	print()
+	print(f"{'LAMA_STARTUP':<14}{'开始响应(s)':>12}{'就绪(s)':>10}")
+	for mode in args.modes.split(','):
+		serving, ready = measure_startup(mode, args.port, args.timeout)
+		print(f"{mode:<14}{fmt(serving):>12}{fmt(ready):>10}")
+
+
+if __name__ == '__main__':
+	main()
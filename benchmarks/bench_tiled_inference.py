@@ -0,0 +1,101 @@
+"""对比单次整图推理与分块推理的峰值内存和耗时
+
+用法（在项目根目录执行）：
+	python benchmarks/bench_tiled_inference.py --width 4000 --height 3000 --budget 1024
+
+每种模式在独立子进程中运行，峰值RSS互不影响。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(ROOT, 'big-lama', 'models', 'best.ckpt.pt')
+
+
+def peak_rss_mb():
+	"""当前进程的峰值RSS（MB）"""
+	import resource
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux 单位为KB，macOS 为字节
+	return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def make_inputs(width, height, mask_ratio):
+	"""生成随机图片和若干块矩形mask，mask覆盖面积约为 mask_ratio"""
+	import numpy as np
+	rng = np.random.default_rng(0)
+	image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+	mask = np.zeros((height, width), dtype=np.float32)
+	side_h = max(8, int(height * mask_ratio ** 0.5 / 2))
+	side_w = max(8, int(width * mask_ratio ** 0.5 / 2))
+	for cy, cx in [(0.25, 0.25), (0.25, 0.75), (0.75, 0.25), (0.75, 0.75)]:
+		y, x = int(height * cy), int(width * cx)
+		mask[y - side_h // 2:y + side_h // 2, x - side_w // 2:x + side_w // 2] = 1
+	return image, mask
+
+
+def run_child(args):
+	sys.path.insert(0, ROOT)
+	os.environ['LAMA_MEMORY_BUDGET_MB'] = str(args.budget)
+	import torch
+	from inpaint import LamaInpainter, load_model
+
+	device = torch.device('cpu')
+	inpainter = LamaInpainter(load_model(MODEL_PATH, device), device)
+	image, mask = make_inputs(args.width, args.height, args.mask_ratio)
+	baseline = peak_rss_mb()
+
+	start = time.perf_counter()
+	if args.child == 'single':
+		inpainter.inpaint_full(image, mask)
+	else:
+		inpainter.inpaint_tiled(image, mask)
+	elapsed = time.perf_counter() - start
+
+	print(json.dumps({
+		'mode': args.child,
+		'seconds': round(elapsed, 2),
+		'baseline_rss_mb': round(baseline, 1),
+		'peak_rss_mb': round(peak_rss_mb(), 1),
+		'tile_size': inpainter.tile_size,
+	}))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--width', type=int, default=4000)
+	parser.add_argument('--height', type=int, default=3000)
+	parser.add_argument('--mask-ratio', type=float, default=0.05, help='mask覆盖面积占比')
+	parser.add_argument('--budget', type=int, default=1024, help='分块推理的内存预算（MB）')
+	parser.add_argument('--modes', default='single,tiled')
+	parser.add_argument('--child', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		run_child(args)
+		return
+
+	if not os.path.exists(MODEL_PATH):
+		sys.exit(f"模型文件不存在: {MODEL_PATH}")
+
+	print(f"图片 {args.width}x{args.height}，mask占比 {args.mask_ratio}，内存预算 {args.budget}MB")
+	print(f"{'模式':<8}{'耗时(s)':>10}{'模型加载后RSS(MB)':>20}{'峰值RSS(MB)':>14}")
+	for mode in args.modes.split(','):
+		cmd = [sys.executable, os.path.abspath(__file__), '--child', mode,
+			'--width', str(args.width), '--height', str(args.height),
+			'--mask-ratio', str(args.mask_ratio), '--budget', str(args.budget)]
+		proc = subprocess.run(cmd, capture_output=True, text=True)
+		lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+		if proc.returncode != 0 or not lines:
+			print(f"{mode:<8}失败: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+			continue
+		result = json.loads(lines[-1])
+		print(f"{mode:<8}{result['seconds']:>10}{result['baseline_rss_mb']:>20}{result['peak_rss_mb']:>14}")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,139 @@
+"""在大文件上传进行中测量 /tasks 的响应延迟
+
+用法（服务已启动，在项目根目录执行）：
+	python benchmarks/load_test_tasks.py --url http://localhost:8080 --uploads 4 --upload-mb 10
+
+上传线程以限速方式持续发送大请求体，模拟弱网下的慢上传；轮询线程不断请求 /tasks，
+最后输出 /tasks 延迟的 p50 / p99 / 最大值。分别用 HTTP_SERVER_MODE=single 和 threaded
+启动服务运行本脚本即可对比。
+"""
+import argparse
+import hashlib
+import http.client
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_token(pwd):
+	time_str = datetime.now().strftime('%Y-%m-%d %H:%M')
+	return hashlib.md5((time_str + pwd).encode()).hexdigest()
+
+
+def percentile(values, p):
+	if not values:
+		return float('nan')
+	values = sorted(values)
+	idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+	return values[idx]
+
+
+def upload_loop(host, port, pwd, payload, kbps, stop):
+	"""循环上传同一个大文件，按 kbps 限速发送请求体"""
+	boundary = 'loadtestboundary'
+	head = (
+		f'--{boundary}\r\n'
+		'Content-Disposition: form-data; name="md5"\r\n\r\n'
+		f'{hashlib.md5(payload).hexdigest()}\r\n'
+		f'--{boundary}\r\n'
+		'Content-Disposition: form-data; name="file"; filename="image.jpg"\r\n'
+		'Content-Type: image/jpeg\r\n\r\n'
+	).encode()
+	tail = f'\r\n--{boundary}--\r\n'.encode()
+	body = head + payload + tail
+	chunk = 64 * 1024
+	delay = chunk / (kbps * 1024) if kbps > 0 else 0
+
+	while not stop.is_set():
+		try:
+			conn = http.client.HTTPConnection(host, port, timeout=120)
+			conn.putrequest('POST', f'/upload?token={make_token(pwd)}')
+			conn.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+			conn.putheader('Content-Length', str(len(body)))
+			conn.endheaders()
+			for i in range(0, len(body), chunk):
+				if stop.is_set():
+					break
+				conn.send(body[i:i + chunk])
+				if delay:
+					time.sleep(delay)
+			if not stop.is_set():
+				conn.getresponse().read()
+			conn.close()
+		except Exception as e:
+			print(f"[WARNING] 上传失败: {e}", file=sys.stderr)
+			time.sleep(1)
+
+
+def poll_loop(host, port, pwd, latencies, errors, stop):
+	"""不断请求 /tasks 并记录延迟"""
+	while not stop.is_set():
+		start = time.perf_counter()
+		try:
+			conn = http.client.HTTPConnection(host, port, timeout=60)
+			conn.request('GET', f'/tasks?page=1&token={make_token(pwd)}')
+			resp = conn.getresponse()
+			resp.read()
+			conn.close()
+			if resp.status == 200:
+				latencies.append(time.perf_counter() - start)
+			else:
+				errors.append(resp.status)
+		except Exception as e:
+			errors.append(str(e))
+		time.sleep(0.05)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--url', default='http://localhost:8080')
+	parser.add_argument('--pwd-file', default=os.path.join(ROOT, 'pwd.txt'))
+	parser.add_argument('--uploads', type=int, default=4, help='并发上传数')
+	parser.add_argument('--upload-mb', type=float, default=10, help='每次上传的大小（MB）')
+	parser.add_argument('--upload-kbps', type=float, default=2048, help='每个上传的限速（KB/s），0表示不限速')
+	parser.add_argument('--image', help='用于上传的图片文件，缺省时生成带JPEG文件头的随机数据')
+	parser.add_argument('--pollers', type=int, default=2, help='并发轮询 /tasks 的客户端数')
+	parser.add_argument('--duration', type=float, default=20, help='测试时长（秒）')
+	args = parser.parse_args()
+
+	url = urlparse(args.url)
+	host, port = url.hostname, url.port or 80
+	try:
+		with open(args.pwd_file) as f:
+			pwd = f.read().strip()
+	except FileNotFoundError:
+		pwd = ''
+
+	if args.image:
+		with open(args.image, 'rb') as f:
+			payload = f.read()
+	else:
+		payload = b'\xff\xd8\xff\xe0' + os.urandom(int(args.upload_mb * 1024 * 1024) - 4)
+
+	stop = threading.Event()
+	latencies, errors = [], []
+	threads = [
+		threading.Thread(target=upload_loop, args=(host, port, pwd, payload, args.upload_kbps, stop), daemon=True)
+		for _ in range(args.uploads)
+	] + [
+		threading.Thread(target=poll_loop, args=(host, port, pwd, latencies, errors, stop), daemon=True)
+		for _ in range(args.pollers)
+	]
+	for t in threads:
+		t.start()
+	print(f"{args.uploads} 个上传（每个 {len(payload) / 1024 / 1024:.1f}MB），{args.pollers} 个 /tasks 轮询，持续 {args.duration}s ...")
+	time.sleep(args.duration)
+	stop.set()
+
+	ms = [v * 1000 for v in latencies]
+	print(f"/tasks 请求数: {len(ms)}，失败: {len(errors)}")
+	print(f"p50: {percentile(ms, 50):.1f}ms  p99: {percentile(ms, 99):.1f}ms  max: {max(ms, default=float('nan')):.1f}ms")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,115 @@
+import os
+
+
+def _env_str(name, default):
+	return os.environ.get(name, default)
+
+
+def _env_int(name, default):
+	try:
+		return int(os.environ.get(name, default))
+	except (TypeError, ValueError):
+		return default
+
+
+def _env_float(name, default):
+	try:
+		return float(os.environ.get(name, default))
+	except (TypeError, ValueError):
+		return default
+
+
+# ---------------- 推理配置 ----------------
+# 模型文件路径
+MODEL_PATH = "big-lama/models/best.ckpt.pt"
+# 推理模式：crop 只对mask外接框(加边距)推理后贴回原图；tiled 整图分块推理并跳过无mask的分块；
+# full 整图缩放到8的倍数后推理（旧行为）
+LAMA_INFERENCE_MODE = _env_str('LAMA_INFERENCE_MODE', 'crop')
+# 裁剪模式下外接框四周保留的上下文边距（像素）
+LAMA_CROP_MARGIN = _env_int('LAMA_CROP_MARGIN', 128)
+# 边距相对外接框长边的比例，与像素边距取较大者，保证大面积涂抹时也有足够上下文
+LAMA_CROP_MARGIN_RATIO = _env_float('LAMA_CROP_MARGIN_RATIO', 0.5)
+# 单次模型推理允许占用的内存预算（MB），超过时裁剪区域会自动改为分块推理
+LAMA_MEMORY_BUDGET_MB = _env_int('LAMA_MEMORY_BUDGET_MB', 2048)
+# 模型推理每像素大致的内存开销（字节），用于由内存预算换算分块大小
+LAMA_BYTES_PER_PIXEL = _env_int('LAMA_BYTES_PER_PIXEL', 4096)
+# 分块之间的重叠宽度（像素），重叠部分做羽化融合
+LAMA_TILE_OVERLAP = _env_int('LAMA_TILE_OVERLAP', 64)
+# 推理worker数量
+LAMA_WORKERS = _env_int('LAMA_WORKERS', 1)
+# worker池模式：process 推理在独立子进程中进行（图片经共享内存传递，子进程崩溃后自动重启），
+# 不与HTTP请求处理争用GIL；thread 多线程在服务进程内共用一份模型（旧行为）
+LAMA_WORKER_MODE = _env_str('LAMA_WORKER_MODE', 'process')
+# 推理worker的启动方式：background 服务开始监听后在后台启动并加载模型；
+# lazy 第一次有待处理任务时才启动（只提供图片的进程不会加载torch）；eager 模型加载完成后才开始处理请求
+LAMA_STARTUP = _env_str('LAMA_STARTUP', 'background')
+# 每个worker的推理线程数，0表示按CPU核心数平均分配
+LAMA_THREADS_PER_WORKER = _env_int('LAMA_THREADS_PER_WORKER', 0)
+# 一次批量推理最多合并的任务数，1表示逐个推理
+LAMA_BATCH_SIZE = _env_int('LAMA_BATCH_SIZE', 4)
+# 凑批时最多等待的时间（秒），保证排队延迟有上限
+LAMA_BATCH_MAX_WAIT = _env_float('LAMA_BATCH_MAX_WAIT', 0.05)
+# 批量推理按裁剪区域尺寸分桶的粒度（像素），同一桶内的区域填充到相同尺寸
+LAMA_BATCH_BUCKET = _env_int('LAMA_BATCH_BUCKET', 128)
+# 模型加载后的TorchScript优化：freeze 冻结参数并内联常量；optimize 在冻结基础上做推理优化
+# （torch.jit.optimize_for_inference，融合卷积等）；none 不优化（旧行为）。优化或预热失败时自动退回未优化的模型
+LAMA_JIT_OPTIMIZE = _env_str('LAMA_JIT_OPTIMIZE', 'freeze')
+# 模型加载后预热推理的尺寸（宽x高，逗号分隔），留空表示不预热
+LAMA_WARMUP_SHAPES = _env_str('LAMA_WARMUP_SHAPES', '512x512')
+# 每个预热尺寸推理的次数，TorchScript前两次调用用于性能分析和图优化
+LAMA_WARMUP_RUNS = _env_int('LAMA_WARMUP_RUNS', 3)
+# 推理的inter-op线程数（算子之间的并行），0表示使用torch默认值；intra-op线程数见 LAMA_THREADS_PER_WORKER
+LAMA_INTEROP_THREADS = _env_int('LAMA_INTEROP_THREADS', 0)
+# 推理时使用 torch.inference_mode（1）还是 torch.no_grad（0）
+LAMA_TORCH_INFERENCE_MODE = _env_int('LAMA_TORCH_INFERENCE_MODE', 1)
+
+# ---------------- 任务队列配置 ----------------
+# 任务存储后端：sqlite 按行更新（首次启动时自动从tasks.json迁移）；json 每次修改整体重写tasks.json（旧行为）
+TASK_STORAGE = _env_str('TASK_STORAGE', 'sqlite')
+TASK_JSON_FILE = _env_str('TASK_JSON_FILE', 'tasks.json')
+TASK_DB_FILE = _env_str('TASK_DB_FILE', 'tasks.db')
+
+# ---------------- HTTP服务配置 ----------------
+# 服务模式：threaded 线程池并发处理请求；single 单线程逐个处理（旧行为）
+HTTP_SERVER_MODE = _env_str('HTTP_SERVER_MODE', 'threaded')
+# threaded 模式下同时处理的最大请求数
+HTTP_MAX_WORKERS = _env_int('HTTP_MAX_WORKERS', 16)
+# /tasks/wait 长轮询最多等待的秒数
+TASK_WAIT_TIMEOUT = _env_float('TASK_WAIT_TIMEOUT', 25)
+# 同时挂起的长轮询请求上限，超出时立即返回让客户端稍后重试；single 模式下不挂起
+TASK_WAIT_MAX_WAITERS = _env_int('TASK_WAIT_MAX_WAITERS', HTTP_MAX_WORKERS // 2 if HTTP_SERVER_MODE != 'single' else 0)
+# 上传文件大小上限（字节）
+UPLOAD_MAX_SIZE = _env_int('UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+# 上传文件在内存中缓冲的上限（字节），超过后转存到临时文件
+UPLOAD_SPOOL_SIZE = _env_int('UPLOAD_SPOOL_SIZE', 1024 * 1024)
+
+# ---------------- 认证配置 ----------------
+# 密码文件，修改后约1秒内生效，无需重启
+AUTH_PASSWORD_FILE = _env_str('AUTH_PASSWORD_FILE', 'pwd.txt')
+# 令牌在生成时间前后多少分钟内有效
+AUTH_TOKEN_WINDOW = _env_int('AUTH_TOKEN_WINDOW', 3)
+
+# ---------------- 图片编码配置 ----------------
+# 保存原图和处理结果时JPEG文件的目标大小（字节）
+JPEG_TARGET_SIZE = _env_int('JPEG_TARGET_SIZE', 500 * 1024)
+# 质量搜索范围
+JPEG_MAX_QUALITY = _env_int('JPEG_MAX_QUALITY', 95)
+JPEG_MIN_QUALITY = _env_int('JPEG_MIN_QUALITY', 30)
+# 任务列表缩略图的最大边长（像素）和质量
+THUMBNAIL_SIZE = _env_int('THUMBNAIL_SIZE', 80)
+THUMBNAIL_QUALITY = _env_int('THUMBNAIL_QUALITY', 60)
+# 预览用缩小版图片允许的宽度（/image/<文件名>?w=宽度，请求的宽度取整到其中不小于它的最小值）
+RENDITION_WIDTHS = _env_str('RENDITION_WIDTHS', '160,320,640,1080')
+# 缩小版图片的编码质量（WebP/JPEG）
+RENDITION_QUALITY = _env_int('RENDITION_QUALITY', 80)
+
+# ---------------- 缓存配置 ----------------
+# 内存中缓存解码后的原图、mask和推理结果数组的总大小上限（MB），0表示不缓存
+IMAGE_CACHE_MB = _env_int('IMAGE_CACHE_MB', 512)
+# 推理结果缓存目录，同一张图片配同一个mask再次提交时直接复用结果
+RESULT_CACHE_DIR = _env_str('RESULT_CACHE_DIR', 'result_cache/')
+# 推理结果缓存的总大小上限（MB），超过时按最近使用时间淘汰，0表示不缓存
+RESULT_CACHE_MB = _env_int('RESULT_CACHE_MB', 1024)
+# 预览用缩小版图片的缓存目录和总大小上限（MB），超过时按最近使用时间淘汰
+RENDITION_DIR = _env_str('RENDITION_DIR', 'renditions/')
+RENDITION_CACHE_MB = _env_int('RENDITION_CACHE_MB', 256)
@@ -0,0 +1,137 @@
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+# 每次 sendfile 发送的字节数
+CHUNK_SIZE = 256 * 1024
+
+
+def copy_file(handler, f, offset, count):
+	"""把文件的 [offset, offset+count) 部分按固定大小分块写入连接
+	使用 socket.sendfile（Linux上为os.sendfile零拷贝），不支持时自动退化为分块读取后发送
+	"""
+	while count > 0:
+		sent = handler.connection.sendfile(f, offset, min(CHUNK_SIZE, count))
+		if not sent:
+			break
+		offset += sent
+		count -= sent
+
+
+def file_validators(st):
+	"""由文件大小和修改时间生成强ETag和Last-Modified，文件被重写（如重新生成结果）后随之变化"""
+	return f'"{st.st_size:x}-{st.st_mtime_ns:x}"', formatdate(st.st_mtime, usegmt=True)
+
+
+def is_not_modified(handler, etag, mtime):
+	"""按 If-None-Match（优先）或 If-Modified-Since 判断客户端缓存是否仍然有效"""
+	if_none_match = handler.headers.get('If-None-Match')
+	if if_none_match is not None:
+		if if_none_match.strip() == '*':
+			return True
+		return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+	if_modified_since = handler.headers.get('If-Modified-Since')
+	if if_modified_since:
+		try:
+			return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+		except (TypeError, ValueError):
+			return False
+	return False
+
+
+class RangeNotSatisfiable(ValueError):
+	"""请求的范围超出文件大小"""
+
+
+def parse_range(value, size):
+	"""解析 Range 请求头，只支持单个字节范围（多个范围时按完整响应处理，这是协议允许的）
+	:return: (起始位置, 结束位置)，均包含在内；格式不支持时返回None
+	:raises RangeNotSatisfiable: 范围超出文件大小
+	"""
+	unit, _, spec = value.partition('=')
+	if unit.strip().lower() != 'bytes' or ',' in spec:
+		return None
+	start, sep, end = spec.strip().partition('-')
+	if not sep:
+		return None
+	try:
+		if not start:
+			# bytes=-N 表示最后N个字节
+			length = int(end)
+			if length <= 0 or size == 0:
+				raise RangeNotSatisfiable(value)
+			return max(0, size - length), size - 1
+		start = int(start)
+		end = int(end) if end else size - 1
+	except ValueError:
+		return None
+	if start >= size:
+		raise RangeNotSatisfiable(value)
+	if end < start:
+		return None
+	return start, min(end, size - 1)
+
+
+def requested_range(handler, size, etag, last_modified):
+	"""按 Range 和 If-Range 请求头确定要发送的范围
+	If-Range 与当前文件的ETag或Last-Modified不一致时说明文件已变化，返回完整内容
+	:return: (起始位置, 结束位置) 或 None 表示发送完整内容
+	:raises RangeNotSatisfiable: 范围超出文件大小
+	"""
+	range_header = handler.headers.get('Range')
+	if not range_header:
+		return None
+	if_range = handler.headers.get('If-Range')
+	if if_range is not None and if_range.strip() not in (etag, last_modified):
+		return None
+	return parse_range(range_header, size)
+
+
+def send_file(handler, path, content_type=None, headers=None, cache_control='no-cache'):
+	"""流式发送文件，不把整个文件读入内存
+	响应带 ETag 和 Last-Modified，客户端缓存仍然有效时返回304且不发送内容；
+	支持 Range/If-Range 断点续传，返回206只发送请求的部分
+	:param handler: BaseHTTPRequestHandler 实例
+	:param headers: 额外的响应头
+	:param cache_control: Cache-Control 响应头，默认要求客户端每次使用缓存前重新验证
+	"""
+	try:
+		f = open(path, 'rb')
+	except (FileNotFoundError, IsADirectoryError):
+		handler.send_error(404, 'File not found')
+		return
+	with f:
+		st = os.fstat(f.fileno())
+		etag, last_modified = file_validators(st)
+		not_modified = is_not_modified(handler, etag, st.st_mtime)
+		byte_range = None
+		if not not_modified:
+			try:
+				byte_range = requested_range(handler, st.st_size, etag, last_modified)
+			except RangeNotSatisfiable:
+				handler.send_response(416)
+				handler.send_header('Content-Range', f'bytes */{st.st_size}')
+				handler.send_header('Content-Length', '0')
+				for name, value in (headers or {}).items():
+					handler.send_header(name, value)
+				handler.end_headers()
+				return
+		
+		handler.send_response(304 if not_modified else 206 if byte_range else 200)
+		handler.send_header('ETag', etag)
+		handler.send_header('Last-Modified', last_modified)
+		handler.send_header('Cache-Control', cache_control)
+		handler.send_header('Accept-Ranges', 'bytes')
+		for name, value in (headers or {}).items():
+			handler.send_header(name, value)
+		if not_modified:
+			handler.end_headers()
+			return
+		
+		start, end = byte_range or (0, st.st_size - 1)
+		handler.send_header('Content-Type', content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream')
+		handler.send_header('Content-Length', str(end - start + 1))
+		if byte_range:
+			handler.send_header('Content-Range', f'bytes {start}-{end}/{st.st_size}')
+		handler.end_headers()
+		copy_file(handler, f, start, end - start + 1)
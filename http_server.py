@@ -0,0 +1,55 @@
+import queue
+import threading
+from http.server import HTTPServer
+from config import HTTP_SERVER_MODE, HTTP_MAX_WORKERS
+
+
+class BoundedThreadingHTTPServer(HTTPServer):
+	"""用固定数量的工作线程处理请求的HTTPServer
+	所有线程都忙时暂停accept，新连接在监听队列中排队，避免线程数随并发无限增长。
+	工作线程是守护线程，退出时不等待进行中的请求（如长轮询、慢速上传）结束
+	"""
+
+	def __init__(self, server_address, handler_class, max_workers=HTTP_MAX_WORKERS):
+		self.requests = queue.Queue()
+		self.slots = threading.BoundedSemaphore(max_workers)
+		self.workers = [
+			threading.Thread(target=self._worker_loop, name=f'http_{i}', daemon=True)
+			for i in range(max_workers)
+		]
+		super().__init__(server_address, handler_class)
+		for worker in self.workers:
+			worker.start()
+
+	def process_request(self, request, client_address):
+		self.slots.acquire()
+		self.requests.put((request, client_address))
+
+	def _worker_loop(self):
+		while True:
+			item = self.requests.get()
+			if item is None:
+				break
+			request, client_address = item
+			try:
+				self.finish_request(request, client_address)
+			except Exception:
+				self.handle_error(request, client_address)
+			finally:
+				self.shutdown_request(request)
+				self.slots.release()
+
+	def server_close(self):
+		super().server_close()
+		# 空闲的工作线程收到None后退出，忙碌的线程随进程退出
+		for _ in self.workers:
+			self.requests.put(None)
+
+
+def create_server(server_address, handler_class, mode=HTTP_SERVER_MODE):
+	"""按配置创建HTTP服务器
+	:param mode: threaded 线程池并发处理；single 单线程逐个处理（旧行为）
+	"""
+	if mode == 'single':
+		return HTTPServer(server_address, handler_class)
+	return BoundedThreadingHTTPServer(server_address, handler_class)
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from threading import Lock
+from config import IMAGE_CACHE_MB
+
+
+class ImageCache:
+	"""按字节数限制大小的LRU缓存，保存解码后的图片数组，键为 (md5, 类别)
+	类别：image 原图RGB数组；mask 二值mask数组；lama (结果文件md5, 结果RGB数组)
+	"""
+
+	def __init__(self, max_bytes=IMAGE_CACHE_MB * 1024 * 1024):
+		self.max_bytes = max_bytes
+		self.lock = Lock()
+		self.entries = OrderedDict()
+		self.total_bytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, md5, kind):
+		"""读取缓存，命中时移到最近使用的位置
+		:return: 缓存的值，未命中时返回None
+		"""
+		with self.lock:
+			entry = self.entries.get((md5, kind))
+			if entry is None:
+				self.misses += 1
+				return None
+			self.entries.move_to_end((md5, kind))
+			self.hits += 1
+			return entry[0]
+
+	def put(self, md5, kind, value, nbytes=None):
+		"""写入缓存，超过容量时淘汰最久未使用的条目
+		:param nbytes: 值占用的字节数，默认取 value.nbytes
+		"""
+		if nbytes is None:
+			nbytes = value.nbytes
+		if nbytes > self.max_bytes:
+			return
+		# 缓存的数组会被多个线程共享，设为只读防止被原地修改
+		for item in (value if isinstance(value, tuple) else (value,)):
+			if hasattr(item, 'flags'):
+				item.flags.writeable = False
+		with self.lock:
+			self._remove((md5, kind))
+			self.entries[(md5, kind)] = (value, nbytes)
+			self.total_bytes += nbytes
+			while self.total_bytes > self.max_bytes:
+				_, (_, evicted) = self.entries.popitem(last=False)
+				self.total_bytes -= evicted
+
+	def invalidate(self, md5, kind=None):
+		"""删除缓存，kind为None时删除该md5的所有类别"""
+		with self.lock:
+			if kind is not None:
+				self._remove((md5, kind))
+				return
+			for key in [key for key in self.entries if key[0] == md5]:
+				self._remove(key)
+
+	def _remove(self, key):
+		entry = self.entries.pop(key, None)
+		if entry is not None:
+			self.total_bytes -= entry[1]
+
+
+# 创建全局图片缓存实例
+image_cache = ImageCache()
@@ -0,0 +1,76 @@
+import hashlib
+from io import BytesIO
+from PIL import Image
+from config import JPEG_TARGET_SIZE, JPEG_MAX_QUALITY, JPEG_MIN_QUALITY, THUMBNAIL_SIZE, THUMBNAIL_QUALITY
+
+
+def _encode(img, quality, **options):
+	buffer = BytesIO()
+	img.save(buffer, format='JPEG', quality=quality, **options)
+	return buffer.getvalue()
+
+
+def encode_jpeg(img, max_bytes=JPEG_TARGET_SIZE, max_quality=JPEG_MAX_QUALITY, min_quality=JPEG_MIN_QUALITY):
+	"""把图片编码为不超过 max_bytes 的JPEG，尽量使用最高的质量
+	先按最高质量编码一次，超出时在 [min_quality, max_quality) 内二分查找质量（最多约7次编码，
+	原来逐档降低质量最多要14次）；最低质量仍然超出时再尝试渐进式编码和霍夫曼表优化
+	:return: (JPEG数据, 信息字典 {'quality', 'size', 'encodes', 'progressive'})
+	"""
+	encodes = 1
+	data = _encode(img, max_quality)
+	info = {'quality': max_quality, 'progressive': False}
+
+	if len(data) > max_bytes:
+		best = None
+		lo, hi = min_quality, max_quality - 1
+		while lo <= hi:
+			quality = (lo + hi) // 2
+			candidate = _encode(img, quality)
+			encodes += 1
+			if len(candidate) <= max_bytes:
+				best = (candidate, quality)
+				lo = quality + 1
+			else:
+				hi = quality - 1
+				if quality == min_quality:
+					data = candidate
+					info['quality'] = quality
+
+		if best is not None:
+			data, info['quality'] = best
+		else:
+			# 最低质量仍然超出：渐进式编码和优化霍夫曼表通常还能再小几个百分点
+			if info['quality'] != min_quality:
+				data = _encode(img, min_quality)
+				encodes += 1
+			candidate = _encode(img, min_quality, optimize=True, progressive=True)
+			encodes += 1
+			if len(candidate) < len(data):
+				data = candidate
+				info['progressive'] = True
+			info['quality'] = min_quality
+
+	info['size'] = len(data)
+	info['encodes'] = encodes
+	return data, info
+
+
+def save_jpeg(img, path, **kwargs):
+	"""按大小限制编码并写入文件，只写一次磁盘
+	:return: 编码信息，见 encode_jpeg，另含写入内容的 md5
+	"""
+	data, info = encode_jpeg(img, **kwargs)
+	info['md5'] = hashlib.md5(data).hexdigest()
+	with open(path, 'wb') as f:
+		f.write(data)
+	print(f"[DEBUG] 图片已保存，质量：{info['quality']}，大小：{info['size']/1024:.1f}KB，"
+		f"编码 {info['encodes']} 次{'（渐进式）' if info['progressive'] else ''}")
+	return info
+
+
+def save_thumbnail(img, path):
+	"""保存任务列表使用的缩略图，原地缩小传入的图片（从JPEG文件打开时解码阶段即按比例缩小）"""
+	img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+	if img.mode != 'RGB':
+		img = img.convert('RGB')
+	img.save(path, format='JPEG', quality=THUMBNAIL_QUALITY)
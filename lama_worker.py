@@ -1,21 +1,140 @@
 import os
 import time
 import threading
-import torch
+import multiprocessing
+import queue
+import shutil
+import atexit
 from PIL import Image
 import numpy as np
-from task_queue import task_queue
-from io import BytesIO
+from task_queue import get_task_queue
+from config import (
+	LAMA_INFERENCE_MODE, LAMA_WORKERS, LAMA_WORKER_MODE, LAMA_THREADS_PER_WORKER,
+	LAMA_BATCH_SIZE, LAMA_BATCH_MAX_WAIT, LAMA_JIT_OPTIMIZE, LAMA_WARMUP_SHAPES, LAMA_WARMUP_RUNS,
+	LAMA_INTEROP_THREADS, MODEL_PATH
+)
+from jpeg_encoder import save_jpeg, save_thumbnail
+from mask_utils import load_mask_info, load_mask_array
+from image_cache import image_cache
+from result_cache import get_result_cache
+from asset_store import asset_store
+from shared_arrays import SharedArray
+from inpaint import expand_box, bucket_shape, fits_single_pass
+
+# 推理子进程异常退出后重新启动的最长间隔（秒），启动后很快又退出时间隔从1秒起逐次加倍
+RESTART_MAX_DELAY = 60
+# 子进程运行超过该时间（秒）后退出视为偶发崩溃，重新启动间隔恢复为1秒
+RESTART_RESET_AFTER = 300
+
+_model_lock = threading.Lock()
+_shared_model = None
+
+def _load_shared_model(device):
+	"""加载进程内共享的模型，线程模式下多个worker共用一份模型
+	加载后按 LAMA_JIT_OPTIMIZE 优化并按 LAMA_WARMUP_SHAPES 预热，优化后的模型预热失败时退回未优化的模型
+	"""
+	global _shared_model
+	with _model_lock:
+		if _shared_model is None:
+			if not os.path.exists(MODEL_PATH):
+				raise FileNotFoundError("模型文件不存在")
+			import torch
+			from inpaint import LamaInpainter, load_model, parse_shapes
+			if LAMA_INTEROP_THREADS:
+				try:
+					# 只能在进程内第一次inter-op并行计算之前设置
+					torch.set_num_interop_threads(LAMA_INTEROP_THREADS)
+				except RuntimeError as e:
+					print(f"[WARNING] 设置inter-op线程数失败: {str(e)}")
+			
+			start = time.perf_counter()
+			model = load_model(MODEL_PATH, device)
+			loaded = time.perf_counter()
+			shapes = parse_shapes(LAMA_WARMUP_SHAPES)
+			try:
+				timings = LamaInpainter(model, device).warm_up(shapes, LAMA_WARMUP_RUNS)
+			except Exception as e:
+				if LAMA_JIT_OPTIMIZE not in ('freeze', 'optimize'):
+					raise
+				print(f"[WARNING] 优化后的模型预热失败，改用未优化的模型: {str(e)}")
+				model = load_model(MODEL_PATH, device, optimize='none')
+				timings = LamaInpainter(model, device).warm_up(shapes, LAMA_WARMUP_RUNS)
+			warmed = time.perf_counter()
+			
+			print(f"[INFO] 模型加载完成: 加载和优化({LAMA_JIT_OPTIMIZE}) {loaded - start:.2f}s，预热 {warmed - loaded:.2f}s，"
+				f"intra-op线程 {torch.get_num_threads()}，inter-op线程 {torch.get_num_interop_threads()}")
+			for (h, w), elapsed in timings:
+				print(f"[INFO] 预热 {w}x{h}: 首次推理 {elapsed[0]:.2f}s，稳定后 {elapsed[-1]:.2f}s（共{len(elapsed)}次）")
+			_shared_model = model
+		return _shared_model
+
+def _bucket_of(md5):
+	"""按上传时保存的mask信息判断任务在裁剪模式下所属的批量推理尺寸桶，不需要解码图片
+	:return: 尺寸桶，无法合批（没有mask信息、mask为空或需要分块推理）时返回None
+	"""
+	try:
+		mask_info = load_mask_info(asset_store.find(md5, 'mask_info'))
+		if mask_info is None or not mask_info['bbox']:
+			return None
+		box = expand_box(mask_info['bbox'], (mask_info['height'], mask_info['width']))
+		return bucket_shape(box) if fits_single_pass(box) else None
+	except Exception as e:
+		# 已领取的任务不能因此丢失，按不能合批处理
+		print(f"[WARNING] 读取mask信息失败: {md5} {str(e)}")
+		return None
+
+def claim_batch(batch_size=LAMA_BATCH_SIZE, max_wait=LAMA_BATCH_MAX_WAIT, timeout=1):
+	"""领取一批待处理任务：最多等待 timeout 秒领到第一个任务，之后最多再等待 max_wait 秒凑批
+	只有裁剪模式下同一尺寸桶的任务能合并为一次模型调用，其他模式每次只领取一个任务；
+	凑批时先查看下一个任务，与第一个任务不同桶时停止，留给空闲的worker，避免多个任务在一个worker上排队
+	:return: 任务md5列表，没有待处理任务时返回空列表
+	"""
+	task_queue = get_task_queue()
+	md5 = task_queue.claim_next_task(timeout)
+	if not md5:
+		return []
+	
+	batch = [md5]
+	if LAMA_INFERENCE_MODE != 'crop' or batch_size <= 1:
+		return batch
+	bucket = _bucket_of(md5)
+	if bucket is None:
+		return batch
+	deadline = time.monotonic() + max_wait
+	while len(batch) < batch_size:
+		md5 = task_queue.get_next_pending_task(max(0, deadline - time.monotonic()))
+		if not md5 or _bucket_of(md5) != bucket:
+			break
+		# 查看后被其他worker领走时停止凑批
+		if task_queue.claim_next_task(expected=md5) != md5:
+			break
+		batch.append(md5)
+	return batch
 
 class LamaWorker:
-	def __init__(self):
-		self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+	def __init__(self, name='LamaWorker', num_threads=None, reporter=None, finisher=None, autostart=True):
+		"""
+		:param name: worker名称，用于日志
+		:param num_threads: 本worker推理使用的线程数，None表示使用torch默认值
+		:param reporter: 任务状态回调，签名同 task_queue.update_task_status
+		:param finisher: 推理结果回调 (md5, 结果数组, mask哈希)，默认保存结果文件并标记任务完成
+		:param autostart: 是否立即启动工作线程
+		"""
+		self.name = name
+		self.num_threads = num_threads
+		self.report = reporter or get_task_queue().update_task_status
+		self.finish = finisher or self._finish
+		# torch 在加载模型时才导入，只负责读取图片和保存结果的worker不导入
+		self.device = None
 		self.model = None
+		self.inpainter = None
 		self.running = False
 		self.thread = None
-		# 自动启动worker
-		self.start()
-		print("[INFO] LamaWorker已自动启动")
+		# 批量推理统计 {批大小: (批次数, 总耗时)}
+		self.batch_stats = {}
+		if autostart:
+			self.start()
+			print(f"[INFO] {self.name}已自动启动")
 	
 	def __del__(self):
 		"""析构函数，确保程序退出时停止worker"""
@@ -24,141 +143,212 @@ class LamaWorker:
 	def load_model(self):
 		"""加载模型"""
 		if self.model is None:
-			print("[DEBUG] 开始加载模型...")
-			model_path = "big-lama/models/best.ckpt.pt"
-			if not os.path.exists(model_path):
-				raise FileNotFoundError("模型文件不存在")
-			
-			self.model = torch.jit.load(model_path, map_location=self.device)
-			self.model.eval()
+			print(f"[DEBUG] {self.name} 开始加载模型...")
+			import torch
+			from inpaint import LamaInpainter
+			self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+			self.model = _load_shared_model(self.device)
+			self.inpainter = LamaInpainter(self.model, self.device)
 			print("[DEBUG] 模型加载成功")
 	
-	def process_image(self, md5):
-		"""处理单个图片"""
+	def _prepare(self, md5):
+		"""读取原图和mask，返回推理所需的数据"""
+		self.report(md5, 'processing', '开始处理图片')
+		
+		# 查找原始图片和mask图片
+		original_image = asset_store.find(md5, 'original')
+		mask_image = asset_store.find(md5, 'mask')
+		if not original_image or not mask_image:
+			raise FileNotFoundError("找不到原始图片或mask图片")
+		
+		# 上传时已计算好mask的外接框和覆盖率，空mask无需解码图片和推理
+		mask_info = load_mask_info(asset_store.find(md5, 'mask_info'))
+		if mask_info is not None and mask_info['coverage'] == 0:
+			return {'md5': md5, 'empty': True, 'original': original_image}
+		
+		self.report(md5, 'processing', '预处理图片', 20)
+		
+		# 读取图片，上传时已缓存解码结果的直接使用
+		image = image_cache.get(md5, 'image')
+		if image is None:
+			image = np.array(Image.open(original_image).convert('RGB'))
+			image_cache.put(md5, 'image', image)
+		h, w = image.shape[:2]
+		
+		self.report(md5, 'processing', '处理mask图片', 40)
+		
+		# 读取mask，统一到原图尺寸
+		mask = image_cache.get(md5, 'mask')
+		if mask is not None and mask.shape == (h, w):
+			mask = mask.astype(np.float32)
+		else:
+			mask = load_mask_array(mask_image, (w, h))
+		bbox = None
+		if mask_info is not None and (mask_info['width'], mask_info['height']) == (w, h):
+			bbox = mask_info['bbox']
+		
+		self.report(md5, 'processing', '准备模型推理', 60)
+		mask_hash = mask_info['hash'] if mask_info is not None else None
+		return {'md5': md5, 'image': image, 'mask': mask, 'bbox': bbox, 'mask_hash': mask_hash}
+	
+	def _finish_empty(self, job):
+		"""mask为空时结果就是原图，直接复制原图和缩略图"""
+		md5 = job['md5']
 		try:
-			task_queue.update_task_status(md5, 'processing', '开始处理图片')
-			image_dir = 'image/'
-			
-			# 查找原始图片和mask图片
-			original_image = None
-			mask_image = None
-			for ext in ['jpg', 'png', 'gif']:
-				img_path = os.path.join(image_dir, f"{md5}.{ext}")
-				if os.path.exists(img_path):
-					original_image = img_path
-					break
-			
-			for ext in ['png', 'jpg', 'gif']:
-				mask_path = os.path.join(image_dir, f"{md5}_mask.{ext}")
-				if os.path.exists(mask_path):
-					mask_image = mask_path
-					break
+			output_path = asset_store.path(md5, 'lama')
+			if job['original'].endswith('.jpg'):
+				shutil.copyfile(job['original'], output_path)
+			else:
+				save_jpeg(Image.open(job['original']).convert('RGB'), output_path)
+			asset_store.record(md5, 'lama')
 			
-			if not original_image or not mask_image:
-				raise FileNotFoundError("找不到原始图片或mask图片")
+			thumb_path = asset_store.find(md5, 'thumb')
+			lama_thumb_path = asset_store.path(md5, 'lama_thumb')
+			if thumb_path and thumb_path.endswith('.jpg'):
+				shutil.copyfile(thumb_path, lama_thumb_path)
+			else:
+				save_thumbnail(Image.open(output_path), lama_thumb_path)
+			asset_store.record(md5, 'lama_thumb')
 			
-			task_queue.update_task_status(md5, 'processing', '预处理图片', 20)
-			
-			# 读取和预处理图片
-			image = Image.open(original_image)
-			w, h = image.size
-			new_h = (h // 8) * 8
-			new_w = (w // 8) * 8
-			if h != new_h or w != new_w:
-				image = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-			
-			image = image.convert('RGB')
-			image = np.array(image)
-			
-			task_queue.update_task_status(md5, 'processing', '处理mask图片', 40)
-			
-			# 处理mask
-			mask = Image.open(mask_image).convert('L')
-			if mask.size != (new_w, new_h):
-				mask = mask.resize((new_w, new_h), Image.Resampling.NEAREST)
-			
-			mask = np.array(mask)
-			mask = (mask > 127).astype(np.float32)
-			if np.mean(mask[mask > 0.5]) < 0.5:
-				mask = 1 - mask
-			
-			task_queue.update_task_status(md5, 'processing', '准备模型推理', 60)
-			
-			# 转换为tensor
-			image = image.astype('float32') / 255.0
-			image = image.transpose(2, 0, 1)
-			image = torch.from_numpy(image).unsqueeze(0).to(self.device)
-			mask = torch.from_numpy(mask).unsqueeze(0).unsqueeze(0).to(self.device)
-			
-			task_queue.update_task_status(md5, 'processing', '正在进行模型推理', 80)
-			
-			# 进行推理
-			with torch.no_grad():
-				output = self.model(image, mask)
-			
-			# 后处理输出
-			output = output.cpu().numpy()[0]
-			output = output.transpose(1, 2, 0)
-			output = (output * 255).clip(0, 255).astype('uint8')
-			
-			# 保存结果
-			output_image = Image.fromarray(output)
-			output_path = os.path.join(image_dir, f"{md5}_lama.jpg")
-			
-			# 保存图片并检查文件大小
-			quality = 95
-			temp_buffer = BytesIO()
+			print(f"[DEBUG] mask为空，直接使用原图作为结果: {md5}")
+			self.report(md5, 'completed', '处理完成（mask为空）', 100)
+		except Exception as e:
+			self._fail(md5, e)
+	
+	def _finish(self, md5, output, mask_hash=None):
+		"""保存推理结果和缩略图，并把任务标记为完成
+		:param mask_hash: mask内容哈希，提供时把结果存入推理结果缓存
+		"""
+		output_image = Image.fromarray(output)
+		output_path = asset_store.path(md5, 'lama')
+		
+		# 保存图片，控制文件大小不超过500KB
+		info = save_jpeg(output_image, output_path)
+		asset_store.record(md5, 'lama', size=info['size'])
+		# 缓存结果及其文件md5，再次Lama时无需重新读取和哈希结果文件
+		image_cache.put(md5, 'lama', (info['md5'], output), output.nbytes)
+		
+		# 保存缩略图（结果已保存，直接原地缩小）
+		thumb_path = asset_store.path(md5, 'lama_thumb')
+		save_thumbnail(output_image, thumb_path)
+		asset_store.record(md5, 'lama_thumb')
+		get_result_cache().store(md5, mask_hash, output_path, thumb_path)
+		
+		self.report(md5, 'completed', '处理完成', 100)
+	
+	def _fail(self, md5, e):
+		"""记录任务失败"""
+		import traceback
+		error_msg = f"处理失败: {str(e)}"
+		detail = traceback.format_exc()
+		print(f"[ERROR] {error_msg}\n{detail}")
+		# 错误堆栈单独保存，任务列表只返回简短的错误信息
+		self.report(md5, 'error', error_msg, detail=detail)
+	
+	def process_image(self, md5):
+		"""处理单个图片"""
+		self.process_batch([md5])
+	
+	def process_batch(self, md5s):
+		"""处理一批图片
+		裁剪模式下能一次推理完成的区域按尺寸分桶，同一桶内的区域填充到相同尺寸后合并为一次模型调用；
+		其余任务（mask为空、需要分块或整图模式）逐个推理
+		"""
+		jobs = []
+		for md5 in md5s:
 			try:
-				while True:
-					# 重置缓冲区位置
-					temp_buffer.seek(0)
-					temp_buffer.truncate()
-					
-					# 保存到临时缓冲区以检查大小
-					output_image.save(temp_buffer, format='JPEG', quality=quality)
-					file_size = temp_buffer.tell()
-					
-					# 如果文件小于500KB或质量已经很低，则保存文件
-					if file_size <= 500 * 1024 or quality <= 30:
-						output_image.save(output_path, format='JPEG', quality=quality)
-						print(f"[DEBUG] 图片已保存，质量：{quality}，大小：{file_size/1024:.1f}KB")
-						break
-					
-					# 否则降低质量继续尝试
-					quality -= 4
-					print(f"[DEBUG] 文件过大 ({file_size/1024:.1f}KB)，降低质量到：{quality}")
-			finally:
-				temp_buffer.close()
-			
-			# 保存缩略图
-			thumb = output_image.copy()
-			thumb.thumbnail((80, 80))
-			thumb.save(os.path.join(image_dir, f"{md5}_lama_thumb.jpg"), "JPEG", quality=60)
-			
-			task_queue.update_task_status(md5, 'completed', '处理完成', 100)
+				jobs.append(self._prepare(md5))
+			except Exception as e:
+				self._fail(md5, e)
+		self.run_jobs(jobs)
+	
+	def run_jobs(self, jobs):
+		"""推理已准备好的任务（_prepare 的返回值），结果交给 finisher"""
+		buckets = {}
+		for job in jobs:
+			if job.get('empty'):
+				self._finish_empty(job)
+				continue
+			if LAMA_INFERENCE_MODE == 'crop' and len(jobs) > 1:
+				box = self.inpainter.crop_box(job['mask'], job['bbox'])
+				if box is not None and self.inpainter.fits_single_pass(box):
+					job['box'] = box
+					buckets.setdefault(self.inpainter.bucket_shape(box), []).append(job)
+					continue
+			self._process_single(job)
+		
+		for shape, group in buckets.items():
+			capacity = self.inpainter.batch_capacity(shape)
+			for i in range(0, len(group), capacity):
+				self._process_group(group[i:i + capacity], shape)
+	
+	def _process_single(self, job):
+		"""单独推理一个任务"""
+		md5 = job['md5']
+		try:
+			self.report(md5, 'processing', '正在进行模型推理', 80)
+			start = time.time()
+			output = self.inpainter.inpaint(job['image'], job['mask'], LAMA_INFERENCE_MODE, job['bbox'])
+			h, w = job['mask'].shape
+			print(f"[INFO] {self.name} 推理: {w}x{h}，耗时 {time.time() - start:.2f}s")
+			self.finish(md5, output, job['mask_hash'])
+		except Exception as e:
+			self._fail(md5, e)
+	
+	def _process_group(self, group, shape):
+		"""把同一尺寸桶内的裁剪区域合并为一次模型调用"""
+		try:
+			images, masks = [], []
+			for job in group:
+				self.report(job['md5'], 'processing', '正在进行模型推理', 80)
+				x0, y0, x1, y1 = job['box']
+				images.append(job['image'][y0:y1, x0:x1])
+				masks.append(job['mask'][y0:y1, x0:x1])
 			
+			start = time.time()
+			results = self.inpainter.run_model_batch(images, masks, shape)
+			self._record_batch(len(group), shape, time.time() - start)
 		except Exception as e:
-			import traceback
-			error_msg = f"处理失败: {str(e)}\n{traceback.format_exc()}"
-			print(f"[ERROR] {error_msg}")
-			task_queue.update_task_status(md5, 'error', error_msg)
+			for job in group:
+				self._fail(job['md5'], e)
+			return
+		
+		for job, result in zip(group, results):
+			try:
+				output = self.inpainter.paste_region(job['image'], job['mask'], job['box'], result)
+				self.finish(job['md5'], output, job['mask_hash'])
+			except Exception as e:
+				self._fail(job['md5'], e)
+	
+	def _record_batch(self, size, shape, elapsed):
+		"""记录批量推理指标，按批大小统计单张平均耗时，便于对比合批收益"""
+		count, total = self.batch_stats.get(size, (0, 0.0))
+		self.batch_stats[size] = (count + 1, total + elapsed)
+		summary = '，'.join(
+			f"批大小{n}: {t / c / n:.2f}s/张"
+			for n, (c, t) in sorted(self.batch_stats.items())
+		)
+		print(f"[INFO] {self.name} 批量推理: {size}张 {shape[1]}x{shape[0]}，耗时 {elapsed:.2f}s，"
+			f"单张 {elapsed / size:.2f}s（累计 {summary}）")
 	
 	def run(self):
 		"""运行工作线程"""
+		if self.num_threads:
+			# OpenMP线程数按调用线程生效，各worker线程分别设置即可划分CPU核心
+			import torch
+			torch.set_num_threads(self.num_threads)
 		while self.running:
 			try:
 				# 加载模型（如果还没加载）
 				if self.model is None:
 					self.load_model()
 				
-				# 获取下一个待处理任务
-				md5 = task_queue.get_next_pending_task()
-				if md5:
-					self.process_image(md5)
-				else:
-					# 没有任务时休眠一段时间
-					time.sleep(1)
-					
+				# 等待并领取下一批待处理任务（原子领取，多个worker不会重复处理），
+				# 新任务加入时立即被唤醒，超时返回以便检查停止标志
+				md5s = claim_batch()
+				if md5s:
+					self.process_batch(md5s)
+				
 			except Exception as e:
 				print(f"[ERROR] 工作线程异常: {str(e)}")
 				time.sleep(1)
@@ -178,12 +368,250 @@ class LamaWorker:
 			self.thread.join()
 			self.thread = None
 
-# 创建全局worker实例
-worker = LamaWorker()
+def _process_worker_main(name, job_queue, event_queue, ready, num_threads):
+	"""进程模式下子进程的入口：只负责模型推理
+	主进程把解码好的原图和mask放在共享内存中派发过来，子进程直接映射这些内存推理，
+	结果写入主进程预先分配的共享内存，再通过 event_queue 通知主进程保存结果和更新任务状态
+	"""
+	def report(md5, status, message='', progress=None, detail=None):
+		event_queue.put((md5, status, message, progress, detail))
+
+	outputs = {}
+	def finish(md5, output, mask_hash=None):
+		outputs[md5][...] = output
+		report(md5, 'inferred')
+
+	if num_threads:
+		import torch
+		torch.set_num_threads(num_threads)
+	worker = LamaWorker(name=name, num_threads=num_threads, reporter=report, finisher=finish, autostart=False)
+	worker.load_model()
+	ready.set()
+	while True:
+		specs = job_queue.get()
+		if specs is None:
+			break
+		buffers, jobs = [], []
+		for spec in specs:
+			image, mask, output = (SharedArray.attach(spec[key]) for key in ('image', 'mask', 'output'))
+			buffers += [image, mask, output]
+			outputs[spec['md5']] = output.array
+			jobs.append({
+				'md5': spec['md5'], 'image': image.array, 'mask': mask.array,
+				'bbox': spec['bbox'], 'mask_hash': spec['mask_hash']
+			})
+		worker.run_jobs(jobs)
+		# 先释放数组视图再解除映射
+		jobs.clear()
+		outputs.clear()
+		for buffer in buffers:
+			buffer.close()
+
+class LamaWorkerPool:
+	"""推理worker池，所有worker从同一个任务队列原子领取任务
+	thread 模式：N个线程共用一份模型，按 threads_per_worker 划分推理线程数
+	process 模式：N个推理子进程各自加载模型，主进程中每个子进程对应一个监督线程，负责领取任务、
+	读取图片并通过共享内存派发、保存推理结果；子进程崩溃不影响HTTP服务，监督线程会重新启动它
+	"""
+	def __init__(self, size=LAMA_WORKERS, mode=LAMA_WORKER_MODE, threads_per_worker=LAMA_THREADS_PER_WORKER):
+		self.size = max(1, size)
+		self.mode = mode
+		self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.size)
+		self.workers = []
+		# {worker名称: (子进程, 任务队列, 模型已加载事件)}，子进程重新启动后更新；
+		# 监督线程会并发修改，读取时先在锁内复制
+		self.processes = {}
+		self.processes_lock = threading.Lock()
+		self.supervisors = []
+		self.running = False
+		self.start()
+		print(f"[INFO] LamaWorkerPool已启动: {self.mode}模式，{self.size}个worker，每个worker {self.threads_per_worker} 个推理线程")
+	
+	def start(self):
+		"""启动所有worker"""
+		if self.running:
+			return
+		self.running = True
+		if self.mode == 'process':
+			for i in range(self.size):
+				supervisor = threading.Thread(target=self._supervise, args=(f"LamaWorker-{i}",), daemon=True)
+				supervisor.start()
+				self.supervisors.append(supervisor)
+		else:
+			for i in range(self.size):
+				self.workers.append(LamaWorker(name=f"LamaWorker-{i}", num_threads=self.threads_per_worker))
+	
+	def _spawn(self, name):
+		"""启动一个推理子进程"""
+		ctx = multiprocessing.get_context('spawn')
+		job_queue = ctx.Queue()
+		event_queue = ctx.Queue()
+		ready = ctx.Event()
+		process = ctx.Process(
+			target=_process_worker_main,
+			args=(name, job_queue, event_queue, ready, self.threads_per_worker),
+			name=name,
+			daemon=True
+		)
+		process.start()
+		with self.processes_lock:
+			self.processes[name] = (process, job_queue, ready)
+		return process, job_queue, event_queue, ready
+	
+	def _supervise(self, name):
+		"""维护一个推理子进程：为它派发任务，异常退出后按退避间隔重新启动"""
+		# 主进程侧的worker只负责读取图片和保存结果，不加载模型
+		host = LamaWorker(name=name, autostart=False)
+		delay = 1
+		while self.running:
+			process, job_queue, event_queue, ready = self._spawn(name)
+			started = time.monotonic()
+			# 模型加载完成后才开始领取任务，加载失败时任务保持等待而不是被标记为失败
+			while self.running and process.is_alive() and not ready.wait(1):
+				pass
+			self._dispatch(name, host, process, job_queue, event_queue)
+			if not self.running:
+				break
+			if time.monotonic() - started > RESTART_RESET_AFTER:
+				delay = 1
+			print(f"[WARNING] {name} 进程已退出（exitcode={process.exitcode}），{delay}秒后重新启动")
+			time.sleep(delay)
+			delay = min(delay * 2, RESTART_MAX_DELAY)
+	
+	def _share(self, host, md5s):
+		"""准备一批任务，把原图和mask复制到共享内存并为结果分配共享内存
+		mask为空的任务直接在主进程完成，不派发给子进程
+		:return: (派发给子进程的任务描述列表, {md5: (共享数组列表, mask哈希)})
+		"""
+		specs, buffers = [], {}
+		for md5 in md5s:
+			arrays = []
+			try:
+				job = host._prepare(md5)
+				if job.get('empty'):
+					host._finish_empty(job)
+					continue
+				arrays.append(SharedArray.copy_of(job['image']))
+				arrays.append(SharedArray.copy_of(job['mask']))
+				arrays.append(SharedArray.create(job['image'].shape, np.uint8))
+			except Exception as e:
+				for array in arrays:
+					array.close()
+				host._fail(md5, e)
+				continue
+			buffers[md5] = (arrays, job['mask_hash'])
+			specs.append({
+				'md5': md5,
+				'image': arrays[0].spec,
+				'mask': arrays[1].spec,
+				'output': arrays[2].spec,
+				'bbox': job['bbox'],
+				'mask_hash': job['mask_hash']
+			})
+		return specs, buffers
+	
+	def _dispatch(self, name, host, process, job_queue, event_queue):
+		"""为一个子进程领取任务并处理其状态更新，子进程退出时返回"""
+		while self.running and process.is_alive():
+			md5s = claim_batch()
+			if not md5s:
+				continue
+			
+			specs, buffers = self._share(host, md5s)
+			if not specs:
+				continue
+			job_queue.put(specs)
+			try:
+				while buffers:
+					try:
+						md5, status, message, progress, detail = event_queue.get(timeout=1)
+					except queue.Empty:
+						if not process.is_alive():
+							print(f"[ERROR] {name} 进程异常退出")
+							for md5 in buffers:
+								get_task_queue().update_task_status(md5, 'error', f'处理失败: {name} 进程异常退出')
+							return
+						continue
+					if status == 'inferred':
+						arrays, mask_hash = buffers.pop(md5)
+						try:
+							# 结果会进入内存缓存，复制出共享内存后再释放
+							host._finish(md5, arrays[2].array.copy(), mask_hash)
+						except Exception as e:
+							host._fail(md5, e)
+						for array in arrays:
+							array.close()
+						continue
+					get_task_queue().update_task_status(md5, status, message, progress, detail)
+					if status == 'error':
+						for array in buffers.pop(md5, ([], None))[0]:
+							array.close()
+			finally:
+				for arrays, _ in buffers.values():
+					for array in arrays:
+						array.close()
+	
+	def _process_items(self):
+		"""各子进程的 (名称, (子进程, 任务队列, 模型已加载事件)) 列表副本"""
+		with self.processes_lock:
+			return list(self.processes.items())
+	
+	def status(self):
+		"""各worker的状态：loading 正在加载模型，ready 可以推理，restarting 子进程已退出等待重新启动"""
+		if self.mode == 'process':
+			return {
+				name: 'restarting' if not process.is_alive() else 'ready' if ready.is_set() else 'loading'
+				for name, (process, job_queue, ready) in self._process_items()
+			}
+		return {worker.name: 'ready' if worker.model is not None else 'loading' for worker in self.workers}
+	
+	def is_ready(self):
+		"""是否至少有一个worker已加载好模型"""
+		return 'ready' in self.status().values()
+	
+	def wait_ready(self, timeout=None):
+		"""等待至少一个worker加载好模型
+		:return: 是否在超时前就绪
+		"""
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while not self.is_ready():
+			if deadline is not None and time.monotonic() >= deadline:
+				return False
+			time.sleep(0.2)
+		return True
+	
+	def stop(self):
+		"""停止所有worker"""
+		self.running = False
+		for worker in self.workers:
+			worker.stop()
+		processes = self._process_items()
+		for name, (process, job_queue, ready) in processes:
+			job_queue.put(None)
+		for name, (process, job_queue, ready) in processes:
+			process.join(timeout=5)
+		self.workers = []
+		with self.processes_lock:
+			self.processes = {}
+		self.supervisors = []
+
+# 全局worker池，由 start_workers 创建，导入本模块不会启动线程或加载模型
+worker = None
+_worker_lock = threading.Lock()
+
+def start_workers():
+	"""创建并启动全局worker池（只创建一次），模型在worker中后台加载
+	:return: worker池
+	"""
+	global worker
+	with _worker_lock:
+		if worker is None:
+			worker = LamaWorkerPool()
+			# 确保程序退出时正确停止worker
+			atexit.register(cleanup)
+		return worker
 
-# 确保程序退出时正确停止worker
-import atexit
 def cleanup():
-	print("[INFO] 正在停止LamaWorker...")
-	worker.stop()
-atexit.register(cleanup) 
\ No newline at end of file
+	if worker is not None:
+		print("[INFO] 正在停止LamaWorker...")
+		worker.stop()
@@ -0,0 +1,16 @@
+"""把旧版本平铺保存在 image/ 下的图片迁移到按md5前缀分片的目录 image/ab/cd/
+未迁移的文件服务仍然可以读取，迁移后大目录中的查找和列目录会快很多。请在服务停止时执行：
+	python migrate_images.py [图片目录]
+"""
+import sys
+from asset_store import AssetStore, IMAGE_DIR
+
+
+def main():
+	image_dir = sys.argv[1] if len(sys.argv) > 1 else IMAGE_DIR
+	moved = AssetStore(image_dir).migrate()
+	print(f"[INFO] 已把 {moved} 个文件迁移到 {image_dir} 下的分片目录")
+
+
+if __name__ == '__main__':
+	main()
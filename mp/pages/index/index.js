@@ -63,16 +63,48 @@ Page({
       });
     }
 
-    // Polling for task status
-    this.taskPollInterval = setInterval(() => {
-      if (this.data.tasks.some(t => t.status === 'pending' || t.status === 'processing')) {
-        this.refreshTaskList();
-      }
-    }, 30000); // Every 30 seconds
+    // Long-poll task changes: the server answers as soon as any task changes
+    this.taskVersion = 0;
+    this.watchingTasks = true;
+    this.watchTasks();
   },
 
   onUnload: function() {
-    clearInterval(this.taskPollInterval);
+    this.watchingTasks = false;
+  },
+
+  watchTasks: async function() {
+    const retryDelay = 5000;
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+    while (this.watchingTasks) {
+      try {
+        const res = await wx.request({
+          url: `${this.data.serverUrl}/tasks/wait?since=${this.taskVersion}&token=${this.getToken()}`,
+          timeout: 60000
+        });
+        if (res.statusCode !== 200) {
+          throw new Error(`HTTP error! status: ${res.statusCode}`);
+        }
+        if (res.data.changed && this.watchingTasks) {
+          // Fetch only what changed on the current page since the last known version
+          const changes = await this.getTaskChanges(this.taskVersion);
+          this.taskVersion = changes ? changes.version : res.data.version;
+          if (changes) {
+            const data = this.mergeTaskChanges(changes) || await this.getTaskStatus(this.data.currentPage);
+            if (!data.error) {
+              this.updateTaskList(data);
+            }
+          }
+        }
+        // The server already holds too many waiting requests, retry later
+        if (res.data.busy) {
+          await sleep(retryDelay);
+        }
+      } catch (error) {
+        console.error('等待任务变化失败:', error);
+        await sleep(retryDelay);
+      }
+    }
   },
 
   handlePasswordInput: function(e) {
@@ -138,8 +170,7 @@ Page({
   calculateMD5: function(filePath) {
     return new Promise((resolve, reject) => {
       wx.getFileSystemManager().readFile({
-        filePath: filePath,
-        encoding: 'binary', // Read as binary to get ArrayBuffer
+        filePath: filePath, // 不指定encoding时返回ArrayBuffer，MD5与服务端按字节计算的结果一致
         success: (res) => {
           const spark = new SparkMD5.ArrayBuffer();
           spark.append(res.data);
@@ -195,7 +226,21 @@ Page({
               image.src = this.originalImage.path;
             });
             tempCtx.drawImage(image, 0, 0, width, height);
-            this.originalImage.path = tempCanvas.toDataURL('image/png'); // Get base64 data URL
+            // 上传的是缩放后的图片：写入临时文件（uploadFile 只接受本地文件路径），
+            // 并按实际上传的字节重新计算MD5，服务端会校验
+            const base64Data = tempCanvas.toDataURL('image/png').replace(/^data:image\/\w+;base64,/, "");
+            const scaledPath = `${wx.env.USER_DATA_PATH}/original_${md5}.png`;
+            await new Promise((resolve, reject) => {
+              wx.getFileSystemManager().writeFile({
+                filePath: scaledPath,
+                data: wx.base64ToArrayBuffer(base64Data),
+                encoding: 'binary',
+                success: resolve,
+                fail: reject
+              });
+            });
+            this.originalImage.path = scaledPath;
+            this.imageMD5 = await this.calculateMD5(scaledPath);
           }
 
           // Initialize mask data (all black)
@@ -493,6 +538,21 @@ Page({
       this.showToast('请先选择一张图片');
       return;
     }
+    // 服务端已有相同内容的原图时跳过上传
+    try {
+      const existsRes = await wx.request({
+        url: `${this.data.serverUrl}/exists?md5=${this.imageMD5}&token=${this.getToken()}`,
+        method: 'GET'
+      });
+      if (existsRes.data && existsRes.data.exists) {
+        this.showToast('原图已存在，跳过上传');
+        this.isImageUploaded = true;
+        return;
+      }
+    } catch (error) {
+      console.warn('查询原图是否存在失败:', error);
+    }
+
     this.showToast('开始原图图片上传 ... ');
     wx.showLoading({ title: '上传原图...' });
 
@@ -643,7 +703,43 @@ Page({
     }
   },
 
+  // Returns null when nothing changed (204)
+  getTaskChanges: async function(since) {
+    const res = await wx.request({
+      url: `${this.data.serverUrl}/tasks?page=${this.data.currentPage}&since=${since}&token=${this.getToken()}`,
+    });
+    if (res.statusCode === 204) {
+      return null;
+    }
+    if (res.statusCode !== 200) {
+      throw new Error(`HTTP error! status: ${res.statusCode}`);
+    }
+    return res.data;
+  },
+
+  // Merge a delta into the displayed page; returns null when a task moved onto
+  // the page that we have no data for, so the whole page must be fetched again
+  mergeTaskChanges: function(changes) {
+    if (changes.full) {
+      return changes;
+    }
+    const taskPage = this.taskPage;
+    if (!taskPage || taskPage.page !== changes.page) {
+      return null;
+    }
+    const tasks = {};
+    for (const md5 of changes.order) {
+      const task = changes.tasks[md5] || taskPage.tasks[md5];
+      if (!task) {
+        return null;
+      }
+      tasks[md5] = task;
+    }
+    return { ...changes, tasks };
+  },
+
   updateTaskList: function(data) {
+    this.taskPage = data;
     const tasks = Object.entries(data.tasks).map(([md5, task]) => ({
       md5,
       ...task,
@@ -797,7 +893,7 @@ Page({
     wx.showLoading({ title: '加载任务...' });
     try {
       // Load original image
-      const originalImagePath = `${this.data.serverUrl}/image/${md5}.jpg?t=${Date.now()}&token=${this.getToken()}`;
+      const originalImagePath = `${this.data.serverUrl}/image/${md5}.jpg`;
       const originalImageInfo = await new Promise((resolve, reject) => {
         wx.getImageInfo({ src: originalImagePath, success: resolve, fail: reject });
       });
@@ -812,7 +908,7 @@ Page({
       });
 
       // Load mask
-      const maskPath = `${this.data.serverUrl}/image/${md5}_mask.png?t=${Date.now()}&token=${this.getToken()}`;
+      const maskPath = `${this.data.serverUrl}/image/${md5}_mask.png`;
       try {
         const maskImageInfo = await new Promise((resolve, reject) => {
           wx.getImageInfo({ src: maskPath, success: resolve, fail: reject });
@@ -856,11 +952,15 @@ Page({
     const isLama = e.currentTarget.dataset.isLama;
     const md5 = url.split('/').pop().split('.')[0].replace('_lama', '');
 
+    // 预览只需要屏幕宽度的图片，服务端按允许的尺寸生成缩小版
+    const systemInfo = wx.getSystemInfoSync();
+    const previewWidth = Math.round(systemInfo.windowWidth * systemInfo.pixelRatio);
+
     this.setData({
       isPreviewing: true,
       isPreviewLoading: true,
-      previewImageOriginal: `${this.data.serverUrl}/image/${md5}.jpg?t=${Date.now()}&token=${this.getToken()}`,
-      previewImageLama: `${this.data.serverUrl}/image/${md5}_lama.jpg?t=${Date.now()}&token=${this.getToken()}`,
+      previewImageOriginal: `${this.data.serverUrl}/image/${md5}.jpg?w=${previewWidth}`,
+      previewImageLama: `${this.data.serverUrl}/image/${md5}_lama.jpg?w=${previewWidth}`,
       previewCurrent: isLama ? 1 : 0
     });
 
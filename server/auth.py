@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import os
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from config import AUTH_PASSWORD_FILE, AUTH_TOKEN_WINDOW
+
+# 密码文件修改时间的检查间隔（秒）
+RELOAD_INTERVAL = 1.0
+
+
+class TokenVerifier:
+	"""校验客户端令牌：令牌为 md5('%Y-%m-%d %H:%M' + 密码)，前后 AUTH_TOKEN_WINDOW 分钟内有效
+	密码只在文件修改时间变化时重新读取，有效令牌每分钟计算一次，校验时只做常量时间比较
+	"""
+
+	def __init__(self, password_file=AUTH_PASSWORD_FILE, window=AUTH_TOKEN_WINDOW):
+		self.password_file = password_file
+		self.window = window
+		self.lock = Lock()
+		self.password = ''
+		self.password_mtime = None
+		self.next_check = 0.0
+		# (分钟, 密码修改时间) -> 有效令牌
+		self.tokens_key = None
+		self.tokens = ()
+
+	def _reload_password(self):
+		"""密码文件修改时间变化时重新读取，需在持有锁时调用"""
+		now = time.monotonic()
+		if now < self.next_check:
+			return
+		self.next_check = now + RELOAD_INTERVAL
+		try:
+			mtime = os.stat(self.password_file).st_mtime_ns
+		except FileNotFoundError:
+			mtime = None
+		if mtime == self.password_mtime:
+			return
+		try:
+			with open(self.password_file, 'r') as f:
+				self.password = f.read().strip()
+		except FileNotFoundError:
+			self.password = ""
+		self.password_mtime = mtime
+		self.tokens_key = None
+
+	def valid_tokens(self):
+		"""当前时间前后 window 分钟内的有效令牌"""
+		with self.lock:
+			self._reload_password()
+			now = datetime.now()
+			key = (now.strftime('%Y-%m-%d %H:%M'), self.password_mtime)
+			if key != self.tokens_key:
+				self.tokens = tuple(
+					hashlib.md5(((now + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M') + self.password).encode()).hexdigest()
+					for i in range(-self.window, self.window + 1)
+				)
+				self.tokens_key = key
+			return self.tokens
+
+	def verify(self, token):
+		"""校验令牌，与每个有效令牌都做一次常量时间比较，耗时与令牌内容无关"""
+		if not token:
+			return False
+		token = token.encode()
+		valid = False
+		for expected in self.valid_tokens():
+			valid |= hmac.compare_digest(token, expected.encode())
+		return valid
+
+
+# 创建全局令牌校验实例
+token_verifier = TokenVerifier()
@@ -0,0 +1,289 @@
+import math
+import time
+import numpy as np
+from PIL import Image
+from config import (
+	LAMA_CROP_MARGIN, LAMA_CROP_MARGIN_RATIO,
+	LAMA_MEMORY_BUDGET_MB, LAMA_BYTES_PER_PIXEL, LAMA_TILE_OVERLAP, LAMA_BATCH_BUCKET,
+	LAMA_JIT_OPTIMIZE, LAMA_TORCH_INFERENCE_MODE
+)
+
+
+def tile_size_for_budget(budget_mb=LAMA_MEMORY_BUDGET_MB, bytes_per_pixel=LAMA_BYTES_PER_PIXEL):
+	"""根据内存预算估算单次推理允许的最大边长（8的倍数）"""
+	side = int(math.sqrt(budget_mb * 1024 * 1024 / bytes_per_pixel))
+	return max(64, side // 8 * 8)
+
+
+def expand_box(bbox, shape):
+	"""给mask外接框加上上下文边距并尽量扩展到8的倍数
+	:param bbox: 外接框 (x0, y0, x1, y1)
+	:param shape: 图片的 (高, 宽)
+	:return: (x0, y0, x1, y1)
+	"""
+	x0, y0, x1, y1 = bbox
+	h, w = shape
+	margin = max(LAMA_CROP_MARGIN, int(max(x1 - x0, y1 - y0) * LAMA_CROP_MARGIN_RATIO))
+	x0, y0 = max(0, x0 - margin), max(0, y0 - margin)
+	x1, y1 = min(w, x1 + margin), min(h, y1 + margin)
+
+	# 尽量向外扩展到8的倍数，减少推理时的填充
+	x1 = min(w, x0 + (x1 - x0 + 7) // 8 * 8)
+	x0 = max(0, x1 - (x1 - x0 + 7) // 8 * 8)
+	y1 = min(h, y0 + (y1 - y0 + 7) // 8 * 8)
+	y0 = max(0, y1 - (y1 - y0 + 7) // 8 * 8)
+	return x0, y0, x1, y1
+
+
+def bucket_shape(box):
+	"""批量推理时裁剪区域所属的尺寸桶，同一桶内的区域填充到相同尺寸后合并推理"""
+	x0, y0, x1, y1 = box
+	step = LAMA_BATCH_BUCKET
+	return (y1 - y0 + step - 1) // step * step, (x1 - x0 + step - 1) // step * step
+
+
+def fits_single_pass(box, tile_size=None):
+	"""裁剪区域是否能在内存预算内一次推理完成"""
+	x0, y0, x1, y1 = box
+	return max(x1 - x0, y1 - y0) <= (tile_size or tile_size_for_budget())
+
+
+def iter_tiles(h, w, tile, overlap):
+	"""按行优先顺序生成相互重叠的分块坐标 (x0, y0, x1, y1)"""
+	def starts(size):
+		if size <= tile:
+			return [0]
+		stride = max(8, tile - overlap)
+		positions = list(range(0, size - tile, stride))
+		positions.append(size - tile)
+		return positions
+
+	for y0 in starts(h):
+		for x0 in starts(w):
+			yield x0, y0, min(w, x0 + tile), min(h, y0 + tile)
+
+
+def _feather_weight(h, w, left, top, overlap):
+	"""分块融合权重：与前面已处理分块重叠的左边/上边做线性渐变"""
+	weight = np.ones((h, w), dtype=np.float32)
+	if left and overlap > 0:
+		n = min(overlap, w)
+		weight[:, :n] *= (np.arange(1, n + 1, dtype=np.float32) / (n + 1))[None, :]
+	if top and overlap > 0:
+		n = min(overlap, h)
+		weight[:n, :] *= (np.arange(1, n + 1, dtype=np.float32) / (n + 1))[:, None]
+	return weight
+
+
+class LamaInpainter:
+	"""封装TorchScript LaMa模型的推理逻辑，不依赖任务队列"""
+
+	def __init__(self, model, device):
+		self.model = model
+		self.device = device
+		self.tile_size = tile_size_for_budget()
+		self.tile_overlap = LAMA_TILE_OVERLAP
+
+	def run_model(self, image, mask):
+		"""对一块区域执行模型推理
+		:param image: HxWx3 uint8 RGB数组
+		:param mask: HxW float32数组，1表示需要擦除
+		:return: HxWx3 uint8 推理结果，尺寸与输入相同
+		"""
+		return self.run_model_batch([image], [mask])[0]
+
+	def run_model_batch(self, images, masks, shape=None):
+		"""一次模型调用推理多块区域
+		:param images: HxWx3 uint8 数组列表，尺寸可以不同
+		:param masks: 与images对应的 HxW float32 数组列表
+		:param shape: 统一填充到的 (高, 宽)，None表示取最大尺寸
+		:return: 与输入一一对应、尺寸相同的 uint8 推理结果列表
+		"""
+		if shape is None:
+			shape = (max(m.shape[0] for m in masks), max(m.shape[1] for m in masks))
+		# 模型要求边长为8的倍数，不足的部分做镜像填充，推理后再裁掉
+		target_h = (shape[0] + 7) // 8 * 8
+		target_w = (shape[1] + 7) // 8 * 8
+
+		batch_images = np.empty((len(images), 3, target_h, target_w), dtype=np.float32)
+		batch_masks = np.empty((len(masks), 1, target_h, target_w), dtype=np.float32)
+		for i, (image, mask) in enumerate(zip(images, masks)):
+			h, w = mask.shape
+			pad_h, pad_w = target_h - h, target_w - w
+			if pad_h or pad_w:
+				image = np.pad(image, ((0, pad_h), (0, pad_w), (0, 0)), mode='symmetric')
+				mask = np.pad(mask, ((0, pad_h), (0, pad_w)), mode='constant')
+			# 转换为NCHW
+			batch_images[i] = image.transpose(2, 0, 1)
+			batch_masks[i, 0] = mask
+		batch_images /= 255.0
+
+		import torch
+		image_tensor = torch.from_numpy(batch_images).to(self.device)
+		mask_tensor = torch.from_numpy(batch_masks).to(self.device)
+
+		# 进行推理，inference_mode 比 no_grad 省去了版本计数和视图追踪的开销
+		with torch.inference_mode() if LAMA_TORCH_INFERENCE_MODE else torch.no_grad():
+			output = self.model(image_tensor, mask_tensor)
+
+		# 后处理输出
+		output = output.cpu().numpy().transpose(0, 2, 3, 1)
+		output = (output * 255).clip(0, 255).astype('uint8')
+		return [output[i, :m.shape[0], :m.shape[1]] for i, m in enumerate(masks)]
+
+	def warm_up(self, shapes, runs):
+		"""按常见尺寸预先推理几次，让TorchScript完成性能分析和图优化、内存分配器完成预分配，
+		第一个用户请求不再承担这部分开销
+		:param shapes: (高, 宽) 列表
+		:return: [((高, 宽), [每次推理耗时])]
+		"""
+		timings = []
+		if runs <= 0:
+			return timings
+		for h, w in shapes:
+			image = np.zeros((h, w, 3), dtype=np.uint8)
+			mask = np.zeros((h, w), dtype=np.float32)
+			mask[h // 4:h * 3 // 4, w // 4:w * 3 // 4] = 1
+			elapsed = []
+			for _ in range(runs):
+				start = time.perf_counter()
+				self.run_model(image, mask)
+				elapsed.append(time.perf_counter() - start)
+			timings.append(((h, w), elapsed))
+		return timings
+
+	def bucket_shape(self, box):
+		"""批量推理时裁剪区域所属的尺寸桶，同一桶内的区域填充到相同尺寸后合并推理"""
+		return bucket_shape(box)
+
+	def batch_capacity(self, shape):
+		"""在内存预算内一个批次最多可以容纳的区域数量"""
+		return max(1, (self.tile_size * self.tile_size) // (shape[0] * shape[1]))
+
+	def fits_single_pass(self, box):
+		"""裁剪区域是否能在内存预算内一次推理完成"""
+		return fits_single_pass(box, self.tile_size)
+
+	def crop_box(self, mask, bbox=None):
+		"""计算mask外接框并加上上下文边距
+		:param bbox: 上传时预先计算好的外接框 [x0, y0, x1, y1]，为None时从mask计算
+		:return: (x0, y0, x1, y1)，mask为空时返回None
+		"""
+		if bbox is None:
+			rows = np.flatnonzero(mask.any(axis=1))
+			if rows.size == 0:
+				return None
+			cols = np.flatnonzero(mask.any(axis=0))
+			y0, y1 = int(rows[0]), int(rows[-1]) + 1
+			x0, x1 = int(cols[0]), int(cols[-1]) + 1
+			bbox = (x0, y0, x1, y1)
+		return expand_box(bbox, mask.shape)
+
+	def inpaint_full(self, image, mask):
+		"""整图模式：缩放到8的倍数后整图推理，结果再缩放回原图尺寸
+		所有推理模式的结果都与原图尺寸相同，进程模式下结果写入按原图尺寸分配的共享内存
+		"""
+		h, w = mask.shape
+		new_h = (h // 8) * 8
+		new_w = (w // 8) * 8
+		if h == new_h and w == new_w:
+			return self.run_model(image, mask)
+		image = np.array(Image.fromarray(image).resize((new_w, new_h), Image.Resampling.LANCZOS))
+		mask = np.array(Image.fromarray(mask).resize((new_w, new_h), Image.Resampling.NEAREST))
+		output = self.run_model(image, mask)
+		return np.array(Image.fromarray(output).resize((w, h), Image.Resampling.LANCZOS))
+
+	def inpaint_region(self, image, mask):
+		"""对一块区域推理，超出内存预算时自动改用分块推理"""
+		h, w = mask.shape
+		if max(h, w) > self.tile_size:
+			return self.inpaint_tiled(image, mask)
+		return self.run_model(image, mask)
+
+	def paste_region(self, image, mask, box, result):
+		"""把区域推理结果中mask覆盖的像素贴回原图，未涂抹的像素保持原样"""
+		x0, y0, x1, y1 = box
+		output = image.copy()
+		region = output[y0:y1, x0:x1]
+		selected = mask[y0:y1, x0:x1] > 0.5
+		region[selected] = result[selected]
+		return output
+
+	def inpaint_crop(self, image, mask, bbox=None):
+		"""裁剪模式：只对mask外接框区域推理，并把擦除的像素贴回原分辨率图片"""
+		box = self.crop_box(mask, bbox)
+		if box is None:
+			print("[DEBUG] mask为空，直接返回原图")
+			return image
+
+		x0, y0, x1, y1 = box
+		print(f"[DEBUG] 裁剪推理区域: ({x0}, {y0})-({x1}, {y1})，原图 {image.shape[1]}x{image.shape[0]}")
+		result = self.inpaint_region(image[y0:y1, x0:x1], mask[y0:y1, x0:x1])
+		return self.paste_region(image, mask, box, result)
+
+	def inpaint_tiled(self, image, mask):
+		"""分块推理：按重叠分块依次推理，跳过不含mask的分块，重叠处羽化融合
+		单次推理的张量大小受 tile_size 限制，峰值内存与输入尺寸无关
+		"""
+		h, w = mask.shape
+		tile, overlap = self.tile_size, self.tile_overlap
+		output = image.copy()
+		processed = skipped = 0
+		for x0, y0, x1, y1 in iter_tiles(h, w, tile, overlap):
+			tile_mask = mask[y0:y1, x0:x1]
+			selected = tile_mask > 0.5
+			if not selected.any():
+				skipped += 1
+				continue
+
+			result = self.run_model(image[y0:y1, x0:x1], tile_mask)
+			# 左边/上边与已处理分块重叠的部分按权重渐变，其余直接覆盖
+			weight = _feather_weight(y1 - y0, x1 - x0, x0 > 0, y0 > 0, overlap)[..., None]
+			region = output[y0:y1, x0:x1]
+			blended = region * (1 - weight) + result * weight
+			region[selected] = blended[selected].round().astype('uint8')
+			processed += 1
+
+		print(f"[DEBUG] 分块推理完成: 分块大小 {tile}，推理 {processed} 块，跳过 {skipped} 块")
+		return output
+
+	def inpaint(self, image, mask, mode, bbox=None):
+		"""按推理模式执行擦除
+		:param mode: crop / tiled / full
+		:param bbox: 预先计算好的mask外接框，仅裁剪模式使用
+		"""
+		if mode == 'full':
+			return self.inpaint_full(image, mask)
+		if mode == 'tiled':
+			return self.inpaint_tiled(image, mask)
+		return self.inpaint_crop(image, mask, bbox)
+
+
+def parse_shapes(value):
+	"""解析 宽x高 逗号分隔的尺寸列表，忽略格式错误的项
+	:return: (高, 宽) 列表
+	"""
+	shapes = []
+	for item in value.split(','):
+		width, _, height = item.strip().lower().partition('x')
+		if width.isdigit() and height.isdigit() and int(width) > 0 and int(height) > 0:
+			shapes.append((int(height), int(width)))
+	return shapes
+
+
+def load_model(model_path, device, optimize=LAMA_JIT_OPTIMIZE):
+	"""加载TorchScript模型
+	:param optimize: freeze 冻结参数；optimize 冻结并做推理优化；none 只加载
+	"""
+	import torch
+	model = torch.jit.load(model_path, map_location=device)
+	model.eval()
+	if optimize not in ('freeze', 'optimize'):
+		return model
+	try:
+		if optimize == 'optimize':
+			return torch.jit.optimize_for_inference(model)
+		return torch.jit.freeze(model)
+	except Exception as e:
+		print(f"[WARNING] 模型优化（{optimize}）失败，使用未优化的模型: {str(e)}")
+		return model
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import numpy as np
+from PIL import Image
+
+# 灰度值不小于该阈值的像素视为需要擦除
+MASK_THRESHOLD = 127
+_BINARY_LUT = [0] * MASK_THRESHOLD + [255] * (256 - MASK_THRESHOLD)
+
+
+def binarize(img):
+	"""把任意模式的mask图片二值化为1位图（查表实现，不逐像素调用Python函数）"""
+	return img.convert('L').point(_BINARY_LUT, '1')
+
+
+def describe(mask):
+	"""计算1位mask的元数据
+	:return: {'width', 'height', 'bbox': [x0, y0, x1, y1] 或 None, 'coverage': 覆盖率, 'hash': 内容哈希}
+	"""
+	w, h = mask.size
+	bbox = mask.getbbox()
+	masked = mask.histogram()[255]
+	return {
+		'width': w,
+		'height': h,
+		'bbox': list(bbox) if bbox else None,
+		'coverage': masked / (w * h) if w and h else 0.0,
+		'hash': hashlib.md5(f"{w}x{h}:".encode() + mask.tobytes()).hexdigest()
+	}
+
+
+def save_mask(img, path, info_path):
+	"""二值化并保存mask及其元数据，上传时调用一次，推理时直接读取元数据
+	:param path: mask图片路径，统一保存为1位PNG
+	:param info_path: 元数据路径
+	:return: (二值化后的1位mask图片, mask元数据)，元数据见 describe
+	"""
+	mask = binarize(img)
+	info = describe(mask)
+	mask.save(path, format='PNG')
+	with open(info_path, 'w') as f:
+		json.dump(info, f)
+	return mask, info
+
+
+def load_mask_info(info_path):
+	"""读取上传时保存的mask元数据，旧数据没有元数据（info_path为None）时返回None"""
+	if not info_path:
+		return None
+	try:
+		with open(info_path, 'r') as f:
+			return json.load(f)
+	except (FileNotFoundError, ValueError):
+		return None
+
+
+def load_mask_array(path, size):
+	"""读取mask并统一到原图尺寸
+	:param size: 原图 (宽, 高)
+	:return: HxW float32数组，1表示需要擦除
+	"""
+	mask = Image.open(path)
+	if mask.mode != '1':
+		mask = binarize(mask)
+	if mask.size != size:
+		mask = mask.resize(size, Image.Resampling.NEAREST)
+	return np.asarray(mask, dtype=np.float32)
@@ -0,0 +1,163 @@
+import hashlib
+import tempfile
+from config import UPLOAD_MAX_SIZE, UPLOAD_SPOOL_SIZE
+
+CHUNK_SIZE = 64 * 1024
+# 普通字段（如md5）的最大长度，防止把大文件当成普通字段读入内存
+MAX_FIELD_SIZE = 64 * 1024
+# multipart 边界、分段头等额外开销的上限，Content-Length 超过 文件上限+此值 时直接拒绝
+MAX_OVERHEAD = 64 * 1024
+
+
+class MultipartError(ValueError):
+	"""请求体不是合法的multipart数据"""
+
+
+class UploadTooLarge(MultipartError):
+	"""上传的文件超过大小限制"""
+
+
+def _parse_boundary(content_type):
+	for param in content_type.split(';')[1:]:
+		key, _, value = param.strip().partition('=')
+		if key.lower() == 'boundary' and value:
+			return value.strip('"').encode()
+	raise MultipartError('缺少multipart边界')
+
+
+def _parse_part_headers(raw):
+	"""解析分段头，返回 (字段名, 文件名)，普通字段的文件名为None"""
+	disposition = ''
+	for line in raw.decode('utf-8', 'replace').split('\r\n'):
+		key, _, value = line.partition(':')
+		if key.strip().lower() == 'content-disposition':
+			disposition = value.strip()
+	if not disposition:
+		return None, None
+
+	# 解析Content-Disposition
+	disp_params = dict(param.strip().split('=', 1) for param in disposition.split(';')[1:] if '=' in param)
+	field_name = disp_params.get('name', '').strip('"')
+	filename = disp_params['filename'].strip('"') if 'filename' in disp_params else None
+	return field_name, filename
+
+
+class _Reader:
+	"""从请求体中按块读取，最多读取 Content-Length 字节"""
+
+	def __init__(self, rfile, content_length):
+		self.rfile = rfile
+		self.remaining = content_length
+
+	def read(self):
+		if self.remaining <= 0:
+			return b''
+		data = self.rfile.read(min(CHUNK_SIZE, self.remaining))
+		if not data:
+			raise MultipartError('请求体不完整')
+		self.remaining -= len(data)
+		return data
+
+
+def parse_multipart(rfile, content_type, content_length, max_file_size=UPLOAD_MAX_SIZE):
+	"""流式解析multipart/form-data请求体
+	文件内容边读边写入 SpooledTemporaryFile（超过 UPLOAD_SPOOL_SIZE 转存磁盘），读取过程中即检查大小限制，
+	峰值内存与请求体大小无关
+	:return: {字段名: 字符串} 或 {字段名: {'filename', 'file', 'size', 'md5'}}，file 已回到开头，由调用方关闭；
+		md5 为边读边计算的文件内容MD5
+	:raises UploadTooLarge: 文件超过 max_file_size
+	:raises MultipartError: 请求体格式错误
+	"""
+	if content_length > max_file_size + MAX_OVERHEAD:
+		raise UploadTooLarge('请求体超过大小限制')
+
+	delimiter = b'\r\n--' + _parse_boundary(content_type)
+	reader = _Reader(rfile, content_length)
+	# 在首个边界前补上\r\n，使所有边界的形式一致
+	buffer = b'\r\n'
+	form_data = {}
+
+	def fill(buffer):
+		data = reader.read()
+		if not data:
+			raise MultipartError('请求体不完整')
+		return buffer + data
+
+	# 跳过首个边界之前的内容
+	while True:
+		idx = buffer.find(delimiter)
+		if idx >= 0:
+			buffer = buffer[idx + len(delimiter):]
+			break
+		buffer = buffer[-len(delimiter):]
+		buffer = fill(buffer)
+
+	try:
+		while True:
+			# 边界后是 -- 表示结束，否则是 \r\n 后跟分段头
+			while len(buffer) < 2:
+				buffer = fill(buffer)
+			if buffer.startswith(b'--'):
+				break
+
+			while b'\r\n\r\n' not in buffer:
+				if len(buffer) > MAX_FIELD_SIZE:
+					raise MultipartError('分段头过长')
+				buffer = fill(buffer)
+			raw_headers, buffer = buffer[2:].split(b'\r\n\r\n', 1)
+			field_name, filename = _parse_part_headers(raw_headers)
+
+			if filename is not None:
+				target = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+				hasher = hashlib.md5()
+				limit = max_file_size
+			else:
+				target = bytearray()
+				limit = MAX_FIELD_SIZE
+			size = 0
+
+			# 读取分段内容直到下一个边界，保留可能是边界开头的尾部字节
+			while True:
+				idx = buffer.find(delimiter)
+				data = buffer[:idx] if idx >= 0 else buffer[:max(0, len(buffer) - len(delimiter) + 1)]
+				size += len(data)
+				if size > limit:
+					if filename is not None:
+						target.close()
+						raise UploadTooLarge('文件超过大小限制')
+					raise MultipartError('字段内容过长')
+				if filename is not None:
+					target.write(data)
+					hasher.update(data)
+				else:
+					target += data
+				if idx >= 0:
+					buffer = buffer[idx + len(delimiter):]
+					break
+				buffer = buffer[len(data):]
+				buffer = fill(buffer)
+
+			if not field_name:
+				if filename is not None:
+					target.close()
+				continue
+			if filename is not None:
+				target.seek(0)
+				form_data[field_name] = {
+					'filename': filename,
+					'file': target,
+					'size': size,
+					'md5': hasher.hexdigest()
+				}
+			else:
+				form_data[field_name] = target.decode('utf-8', 'replace')
+	except Exception:
+		for value in form_data.values():
+			if isinstance(value, dict):
+				value['file'].close()
+		raise
+
+	# 读掉结束边界之后的剩余内容
+	while reader.read():
+		pass
+	return form_data
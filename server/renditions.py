@@ -0,0 +1,118 @@
+import os
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+from PIL import Image, features
+from config import RENDITION_WIDTHS, RENDITION_DIR, RENDITION_CACHE_MB, RENDITION_QUALITY
+
+WIDTHS = sorted({int(w) for w in RENDITION_WIDTHS.split(',') if w.strip().isdigit() and int(w) > 0}) or [160, 320, 640, 1080]
+WEBP_SUPPORTED = features.check('webp')
+
+
+def snap_width(width):
+	"""把请求的宽度取整到允许的尺寸：不小于请求宽度的最小尺寸，超过最大尺寸时取最大尺寸"""
+	idx = bisect_left(WIDTHS, width)
+	return WIDTHS[min(idx, len(WIDTHS) - 1)]
+
+
+class RenditionCache:
+	"""按需生成的缩小版图片（预览用），保存在 RENDITION_DIR 中，总大小超过 RENDITION_CACHE_MB 时按最近使用时间淘汰
+	文件名包含源文件的大小和修改时间，源文件被覆盖（如重新处理）后自动生成新版本，旧版本随淘汰删除
+	"""
+
+	def __init__(self, cache_dir=RENDITION_DIR, max_bytes=RENDITION_CACHE_MB * 1024 * 1024):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.lock = Lock()
+		# {文件名: 大小}，按最近使用时间升序
+		self.entries = OrderedDict()
+		self.total_bytes = 0
+		self._scan()
+
+	def _scan(self):
+		"""按修改时间加载已有的缓存文件"""
+		if not os.path.isdir(self.cache_dir):
+			return
+		files = [entry for entry in os.scandir(self.cache_dir) if entry.is_file() and not entry.name.endswith('.tmp')]
+		for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+			self.entries[entry.name] = entry.stat().st_size
+			self.total_bytes += entry.stat().st_size
+
+	def get(self, source_path, width, webp=False):
+		"""获取源图片指定宽度的缩小版，不存在时生成
+		:param width: 已取整到允许尺寸的宽度
+		:param webp: 客户端是否接受WebP
+		:return: (文件路径, Content-Type)；源图片不比目标宽度大时直接返回源图片
+		"""
+		st = os.stat(source_path)
+		ext = 'webp' if webp and WEBP_SUPPORTED else 'jpg'
+		stem = os.path.splitext(os.path.basename(source_path))[0]
+		name = f"{stem}_w{width}_{st.st_size:x}{st.st_mtime_ns:x}.{ext}"
+		path = os.path.join(self.cache_dir, name)
+		content_type = 'image/webp' if ext == 'webp' else 'image/jpeg'
+
+		with self.lock:
+			hit = name in self.entries
+			if hit:
+				self.entries.move_to_end(name)
+		if hit and os.path.exists(path):
+			return path, content_type
+
+		if not self._render(source_path, width, path, ext):
+			return source_path, None
+		self._add(name, os.path.getsize(path))
+		return path, content_type
+
+	def _render(self, source_path, width, path, ext):
+		"""生成缩小版，先写临时文件再原子替换，并发请求同一尺寸时不会读到写了一半的文件
+		:return: 是否生成（源图片不比目标宽度大时不生成）
+		"""
+		with Image.open(source_path) as source:
+			if source.width <= width:
+				return False
+			height = max(1, round(source.height * width / source.width))
+			# JPEG在解码时直接按1/2、1/4、1/8缩小，只解码需要的分辨率
+			source.draft('RGB', (width, height))
+			img = source.convert('RGB')
+		if img.width != width:
+			img = img.resize((width, height), Image.Resampling.LANCZOS)
+
+		os.makedirs(self.cache_dir, exist_ok=True)
+		temp_path = f"{path}.{threading.get_ident()}.tmp"
+		if ext == 'webp':
+			img.save(temp_path, format='WEBP', quality=RENDITION_QUALITY, method=4)
+		else:
+			img.save(temp_path, format='JPEG', quality=RENDITION_QUALITY, optimize=True, progressive=True)
+		os.replace(temp_path, path)
+		return True
+
+	def _add(self, name, size):
+		"""登记新生成的文件，超出容量时淘汰最久未使用的文件"""
+		evicted = []
+		with self.lock:
+			self.total_bytes -= self.entries.pop(name, 0)
+			self.entries[name] = size
+			self.total_bytes += size
+			while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+				old_name, old_size = self.entries.popitem(last=False)
+				self.total_bytes -= old_size
+				evicted.append(old_name)
+		for old_name in evicted:
+			try:
+				os.remove(os.path.join(self.cache_dir, old_name))
+			except FileNotFoundError:
+				pass
+
+
+# 全局缩小版图片缓存实例，由 get_rendition_cache 在第一次使用时创建，导入本模块不会扫描缓存目录
+_rendition_cache = None
+_rendition_cache_lock = Lock()
+
+def get_rendition_cache():
+	"""获取全局缩小版图片缓存实例，第一次调用时扫描缓存目录"""
+	global _rendition_cache
+	with _rendition_cache_lock:
+		if _rendition_cache is None:
+			_rendition_cache = RenditionCache()
+		return _rendition_cache
@@ -0,0 +1,136 @@
+import os
+import shutil
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from config import (
+	RESULT_CACHE_DIR, RESULT_CACHE_MB, MODEL_PATH, LAMA_INFERENCE_MODE, LAMA_CROP_MARGIN, LAMA_CROP_MARGIN_RATIO,
+	LAMA_MEMORY_BUDGET_MB, LAMA_BYTES_PER_PIXEL, LAMA_TILE_OVERLAP
+)
+from asset_store import asset_store
+
+
+def settings_fingerprint(model_path=MODEL_PATH):
+	"""影响推理结果的配置和模型文件（大小、修改时间）的短哈希
+	修改推理模式、裁剪边距、分块参数或更换模型后，不再命中旧配置下缓存的结果
+	"""
+	try:
+		stat = os.stat(model_path)
+		model = (stat.st_size, stat.st_mtime_ns)
+	except OSError:
+		model = None
+	settings = (
+		LAMA_INFERENCE_MODE, LAMA_CROP_MARGIN, LAMA_CROP_MARGIN_RATIO,
+		LAMA_MEMORY_BUDGET_MB, LAMA_BYTES_PER_PIXEL, LAMA_TILE_OVERLAP, model
+	)
+	return hashlib.md5(repr(settings).encode()).hexdigest()[:8]
+
+
+class ResultCache:
+	"""推理结果缓存，键为 (原图md5, mask内容哈希, 推理配置哈希)，同一张图片配同一个mask再次提交时直接复用结果
+	结果和缩略图以文件形式保存在 RESULT_CACHE_DIR 中，多个进程共用；
+	总大小超过 RESULT_CACHE_MB 时按最近使用时间淘汰，其他配置下缓存的结果不会命中，随时间淘汰
+	"""
+
+	def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MB * 1024 * 1024):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.fingerprint = settings_fingerprint()
+		self.lock = Lock()
+		# {文件名前缀: 占用字节数}，按最近使用时间升序
+		self.entries = OrderedDict()
+		self.total_bytes = 0
+		self._scan()
+
+	def _scan(self):
+		"""按修改时间加载已有的缓存文件"""
+		if not os.path.isdir(self.cache_dir):
+			return
+		found = {}
+		for entry in os.scandir(self.cache_dir):
+			if not entry.name.endswith('.jpg'):
+				continue
+			key = entry.name[:-len('.jpg')].removesuffix('_thumb')
+			stat = entry.stat()
+			size, mtime = found.get(key, (0, 0))
+			found[key] = (size + stat.st_size, max(mtime, stat.st_mtime))
+		for key, (size, _) in sorted(found.items(), key=lambda item: item[1][1]):
+			self.entries[key] = size
+			self.total_bytes += size
+
+	def _key(self, md5, mask_hash):
+		return f"{md5}_{mask_hash}_{self.fingerprint}"
+
+	def _paths(self, key):
+		return (
+			os.path.join(self.cache_dir, f"{key}.jpg"),
+			os.path.join(self.cache_dir, f"{key}_thumb.jpg")
+		)
+
+	def restore(self, md5, mask_hash):
+		"""缓存命中时把结果和缩略图复制为该md5的推理结果和结果缩略图
+		:return: 是否命中
+		"""
+		if not mask_hash or self.max_bytes <= 0:
+			return False
+		key = self._key(md5, mask_hash)
+		result_path, thumb_path = self._paths(key)
+		try:
+			shutil.copyfile(result_path, asset_store.path(md5, 'lama'))
+			shutil.copyfile(thumb_path, asset_store.path(md5, 'lama_thumb'))
+		except FileNotFoundError:
+			return False
+		asset_store.record(md5, 'lama')
+		asset_store.record(md5, 'lama_thumb')
+		# 更新修改时间，重启后仍按最近使用时间淘汰
+		os.utime(result_path)
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+		print(f"[DEBUG] 命中推理结果缓存: {key}")
+		return True
+
+	def store(self, md5, mask_hash, result_path, thumb_path):
+		"""把推理结果和缩略图复制到缓存中，超出容量时淘汰最久未使用的结果"""
+		if not mask_hash or self.max_bytes <= 0:
+			return
+		key = self._key(md5, mask_hash)
+		cached_result, cached_thumb = self._paths(key)
+		try:
+			os.makedirs(self.cache_dir, exist_ok=True)
+			# 先复制缩略图，保证结果文件存在时缩略图一定存在
+			shutil.copyfile(thumb_path, cached_thumb)
+			shutil.copyfile(result_path, cached_result)
+		except OSError as e:
+			print(f"[WARNING] 保存推理结果缓存失败: {str(e)}")
+			return
+		size = os.path.getsize(cached_result) + os.path.getsize(cached_thumb)
+
+		evicted = []
+		with self.lock:
+			self.total_bytes -= self.entries.pop(key, 0)
+			self.entries[key] = size
+			self.total_bytes += size
+			while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+				old_key, old_size = self.entries.popitem(last=False)
+				self.total_bytes -= old_size
+				evicted.append(old_key)
+		for old_key in evicted:
+			for path in self._paths(old_key):
+				try:
+					os.remove(path)
+				except FileNotFoundError:
+					pass
+
+
+# 全局推理结果缓存实例，由 get_result_cache 在第一次使用时创建，导入本模块不会扫描缓存目录
+_result_cache = None
+_result_cache_lock = Lock()
+
+def get_result_cache():
+	"""获取全局推理结果缓存实例，第一次调用时扫描缓存目录"""
+	global _result_cache
+	with _result_cache_lock:
+		if _result_cache is None:
+			_result_cache = ResultCache()
+		return _result_cache
@@ -1,18 +1,28 @@
 import os
 import json
 import hashlib
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from email.parser import BytesParser
-from io import BytesIO
 import mimetypes
 from PIL import Image
 import numpy as np
-import torch
 import time
-from datetime import datetime, timedelta
-from task_queue import task_queue
-from lama_worker import worker
+from http_server import create_server
+from auth import token_verifier
+from multipart import parse_multipart, UploadTooLarge, MultipartError
+from jpeg_encoder import save_jpeg, save_thumbnail
+from renditions import get_rendition_cache, snap_width
+from mask_utils import save_mask, load_mask_info
+from asset_store import asset_store
+from file_sender import send_file
+from image_cache import image_cache
+from result_cache import get_result_cache
+from config import UPLOAD_MAX_SIZE, LAMA_STARTUP
+from task_queue import get_task_queue
+import lama_worker
+
+# 永不变化的图片的缓存策略
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
 
 class UploadHandler(BaseHTTPRequestHandler):
     def get_content_type(self, path):
@@ -24,29 +34,9 @@ class UploadHandler(BaseHTTPRequestHandler):
         return '..' not in requested_path
 
     def verify_token(self):
-        try:
-            with open('pwd.txt', 'r') as f:
-                pwd = f.read().strip()
-        except FileNotFoundError:
-            pwd = ""
-
-        parsed_path = urlparse(self.path)
-        query_params = parse_qs(parsed_path.query)
-        token = query_params.get('token', [None])[0]
-
-        if not token:
-            return False
-
-        now = datetime.now()
-        
-        for i in range(-3, 4):
-            check_time = now + timedelta(minutes=i)
-            time_str = check_time.strftime('%Y-%m-%d %H:%M')
-            expected_token = hashlib.md5((time_str + pwd).encode()).hexdigest()
-            if token == expected_token:
-                return True
-        
-        return False
+        """校验请求中的令牌，密码和有效令牌由 token_verifier 缓存"""
+        query_params = parse_qs(urlparse(self.path).query)
+        return token_verifier.verify(query_params.get('token', [None])[0])
 
     def do_GET(self):
         # 解析请求的路径
@@ -55,7 +45,7 @@ class UploadHandler(BaseHTTPRequestHandler):
 
         # --- User's specified authentication logic ---
         # Exclude token verification for index.html, spark-md5.min.js and /image/ path
-        if request_path not in ['/', '/index.html', '/spark-md5.min.js'] and not request_path.startswith('/image/'):
+        if request_path not in ['/', '/index.html', '/spark-md5.min.js', '/ready'] and not request_path.startswith('/image/'):
             if not self.verify_token():
                 self.send_error(401, 'Unauthorized')
                 return
@@ -65,67 +55,136 @@ class UploadHandler(BaseHTTPRequestHandler):
         if request_path == '/':
             file_to_serve = os.path.join(os.getcwd(), 'index.html')
             if os.path.exists(file_to_serve):
-                with open(file_to_serve, 'rb') as f:
-                    content = f.read()
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html')
-                self.send_header('Content-Length', len(content))
-                self.send_header('Access-Control-Allow-Origin', '*') # Ensure CORS for index.html
-                self.end_headers()
-                self.wfile.write(content)
+                # Ensure CORS for index.html
+                send_file(self, file_to_serve, 'text/html', {'Access-Control-Allow-Origin': '*'})
                 return
             else:
                 self.send_error(404, 'index.html not found')
                 return
         # --- End index.html handling ---
 
-        # Handle task status query (existing code)
-        if request_path == '/tasks':
+        # Readiness probe: 200 once an inference worker has loaded the model, 503 otherwise
+        if request_path == '/ready':
+            pool = lama_worker.worker
+            workers = pool.status() if pool is not None else {}
+            # lazy 启动方式下还没有任务时无需等待模型
+            ready = pool.is_ready() if pool is not None else LAMA_STARTUP == 'lazy'
+            self.send_response(200 if ready else 503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(json.dumps({'ready': ready, 'startup': LAMA_STARTUP, 'workers': workers}).encode())
+            return
+        
+        # 上传前查询原图是否已存在，已存在时客户端可以跳过上传
+        if request_path == '/exists':
+            md5 = parse_qs(parsed_path.query).get('md5', [''])[0]
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
+            response = {
+                'status': 'success',
+                'md5': md5,
+                'exists': bool(md5) and self.image_exists(md5)
+            }
+            self.wfile.write(json.dumps(response).encode())
+            return
+        
+        # 长轮询：等待任务在 since 版本之后发生变化，有变化时立即返回，客户端据此刷新任务列表
+        if request_path == '/tasks/wait':
+            query_params = parse_qs(parsed_path.query)
+            md5 = query_params.get('md5', [None])[0]
+            try:
+                since = int(query_params.get('since', ['0'])[0])
+            except ValueError:
+                since = 0
+            version, busy = get_task_queue().wait_for_change(since, md5)
+            response = {
+                'status': 'success',
+                'version': version,
+                'changed': version != since,
+                'busy': busy
+            }
+            if md5 is not None:
+                response['task'] = get_task_queue().get_task_status(md5)
             
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps(response).encode())
+            return
+        
+        # Handle task status query (existing code)
+        if request_path == '/tasks':
             # Get query parameters
             query_params = parse_qs(parsed_path.query)
             md5 = query_params.get('md5', [None])[0]
             page = int(query_params.get('page', ['1'])[0])
             per_page = int(query_params.get('per_page', ['5'])[0])
+            # 游标分页：传入上一页返回的 next_after
+            after = query_params.get('after', [None])[0]
+            after = float(after) if after else None
+            since = query_params.get('since', [''])[0]
             
-            # Get task status
-            status = task_queue.get_task_status(md5, page, per_page)
+            if since.isdigit() and md5 is None:
+                # Delta query: only changes after version `since`, 204 when nothing changed
+                status = get_task_queue().get_changes(int(since), page, per_page, after)
+                if status is None:
+                    self.send_response(204)
+                    self.send_header('Access-Control-Allow-Origin', '*')
+                    self.end_headers()
+                    return
+            else:
+                # Get task status
+                status = get_task_queue().get_task_status(md5, page, per_page, after)
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
             self.wfile.write(json.dumps(status).encode())
             return
         
-        # Handle image serving (existing code)
+        # Task detail including the error traceback (omitted from list and delta responses)
+        if request_path == '/tasks/detail':
+            md5 = parse_qs(parsed_path.query).get('md5', [''])[0]
+            task = get_task_queue().get_task_detail(md5)
+            if task is None:
+                self.send_error(404, 'Task not found')
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps({'status': 'success', 'md5': md5, 'task': task}).encode())
+            return
+        
+        # Handle image serving: images are sharded by md5 prefix, resolve the real path from the asset index
         if request_path.startswith('/image/'):
-            # Security check: ensure path does not contain ..
-            if not self.is_safe_path(request_path):
-                self.send_error(403, 'Access Forbidden')
+            filename = request_path[len('/image/'):]
+            file_path = asset_store.resolve(filename)
+            if not file_path:
+                self.send_error(404, 'File not found')
                 return
             
-            # Get absolute path of the file, remove leading /
-            file_path = os.path.join(os.getcwd(), request_path.lstrip('/'))
-            
+            # Originals and their thumbnails are named by content md5 and never change, so they can be cached forever;
+            # masks and results are overwritten and must be revalidated with the ETag
+            cache_control = IMMUTABLE_CACHE_CONTROL if asset_store.is_immutable(filename) else 'no-cache'
             try:
-                # Check if file exists
-                if not os.path.exists(file_path):
-                    self.send_error(404, 'File not found')
-                    return
-                    
-                # Read file content
-                with open(file_path, 'rb') as f:
-                    content = f.read()
-                    
-                # Send response headers
-                self.send_response(200)
-                self.send_header('Content-Type', self.get_content_type(file_path))
-                self.send_header('Content-Length', len(content))
-                self.end_headers()
-                
-                # Send file content
-                self.wfile.write(content)
-                
+                content_type = self.get_content_type(file_path)
+                headers = None
+                # ?w=<width> returns a downscaled preview rendition, the width is snapped to the allowed sizes
+                # and WebP is used when the client accepts it
+                width = parse_qs(parsed_path.query).get('w', [''])[0]
+                if width.isdigit() and asset_store.is_renderable(filename):
+                    webp = 'image/webp' in self.headers.get('Accept', '')
+                    file_path, rendition_type = get_rendition_cache().get(file_path, snap_width(int(width)), webp)
+                    content_type = rendition_type or content_type
+                    headers = {'Vary': 'Accept'}
+                # Stream the file instead of reading it into memory
+                send_file(self, file_path, content_type, headers, cache_control)
             except Exception as e:
                 self.send_error(500, f'Internal server error: {str(e)}')
             return
@@ -136,14 +195,9 @@ class UploadHandler(BaseHTTPRequestHandler):
             file_to_serve = os.path.join(os.getcwd(), request_path.lstrip('/'))
             if os.path.exists(file_to_serve) and os.path.isfile(file_to_serve):
                 try:
-                    with open(file_to_serve, 'rb') as f:
-                        content = f.read()
-                    self.send_response(200)
-                    self.send_header('Content-Type', self.get_content_type(file_to_serve))
-                    self.send_header('Content-Length', len(content))
-                    self.send_header('Access-Control-Allow-Origin', '*') # Ensure CORS for static files
-                    self.end_headers()
-                    self.wfile.write(content)
+                    # Ensure CORS for static files
+                    send_file(self, file_to_serve, self.get_content_type(file_to_serve),
+                              {'Access-Control-Allow-Origin': '*'})
                     return
                 except Exception as e:
                     self.send_error(500, f'Internal server error serving static file: {str(e)}')
@@ -154,6 +208,18 @@ class UploadHandler(BaseHTTPRequestHandler):
         self.send_error(404, 'Not Found')
 
 
+    def queue_inference(self, md5):
+        """添加推理任务；推理worker尚未启动（lazy 启动方式）时随之启动，模型在后台加载
+        :return: 是否添加成功
+        """
+        added = get_task_queue().add_task(md5)
+        lama_worker.start_workers()
+        return added
+
+    def image_exists(self, md5):
+        """检查md5对应的原图和缩略图是否都已保存"""
+        return asset_store.exists(md5, 'original', 'thumb')
+
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -177,7 +243,7 @@ class UploadHandler(BaseHTTPRequestHandler):
                 }
             
             # 删除任务及相关文件
-            return task_queue.delete_task(data['md5'])
+            return get_task_queue().delete_task(data['md5'])
         except json.JSONDecodeError:
             return {
                 'status': 'error',
@@ -192,6 +258,16 @@ class UploadHandler(BaseHTTPRequestHandler):
                 'message': f'删除任务失败: {str(e)}'
             }
 
+    def restore_cached_result(self, md5):
+        """同一张图片配同一个mask已经处理过时，直接复用缓存的结果并把任务添加为已完成
+        :return: 是否命中缓存
+        """
+        mask_info = load_mask_info(asset_store.find(md5, 'mask_info'))
+        if mask_info is None or not get_result_cache().restore(md5, mask_info['hash']):
+            return False
+        get_task_queue().add_task(md5, completed=True)
+        return True
+
     def handle_relama_request(self):
         """处理再次Lama的请求"""
         try:
@@ -206,56 +282,94 @@ class UploadHandler(BaseHTTPRequestHandler):
                 }
             
             md5 = data['md5']
-            image_dir = 'image/'
             
             # 检查lama处理后的图片是否存在
-            lama_image = os.path.join(image_dir, f"{md5}_lama.jpg")
-            if not os.path.exists(lama_image):
+            lama_image = asset_store.find(md5, 'lama')
+            if not lama_image:
                 return {
                     'status': 'error',
                     'message': '找不到已处理的图片'
                 }
             
             # 查找原始mask图片
-            mask_image = None
-            for ext in ['png', 'jpg', 'gif']:
-                mask_path = os.path.join(image_dir, f"{md5}_mask.{ext}")
-                if os.path.exists(mask_path):
-                    mask_image = mask_path
-                    mask_ext = ext
-                    break
-            
+            mask_image = asset_store.find(md5, 'mask')
             if not mask_image:
                 return {
                     'status': 'error',
                     'message': '找不到原始mask图片'
                 }
             
-            # 生成新的MD5值
-            with open(lama_image, 'rb') as f:
-                file_content = f.read()
-                new_md5 = hashlib.md5(file_content).hexdigest()
+            # 生成新的MD5值，结果仍在缓存中时直接使用推理时计算的MD5和解码数组
+            cached = image_cache.get(md5, 'lama')
+            if cached is not None:
+                new_md5, output = cached
+            else:
+                with open(lama_image, 'rb') as f:
+                    file_content = f.read()
+                    new_md5 = hashlib.md5(file_content).hexdigest()
+                output = None
             
-            # 复制lama处理后的图片作为新的原始图片
-            new_image = os.path.join(image_dir, f"{new_md5}.jpg")
+            # mask为空时结果就是原图本身，再次处理不会有任何变化
+            if new_md5 == md5:
+                return {
+                    'status': 'success',
+                    'message': '处理结果与原图相同，无需再次处理',
+                    'new_md5': md5,
+                    'unchanged': True
+                }
+            
+            # 复制lama处理后的图片作为新的原始图片，文件以内容MD5命名，已存在时无需复制
             import shutil
-            shutil.copy2(lama_image, new_image)
+            new_image = asset_store.find(new_md5, 'original')
+            if not new_image:
+                new_image = asset_store.path(new_md5, 'original')
+                shutil.copy2(lama_image, new_image)
+                asset_store.record(new_md5, 'original')
             
-            # 复制原始mask图片
-            new_mask = os.path.join(image_dir, f"{new_md5}_mask.{mask_ext}")
-            shutil.copy2(mask_image, new_mask)
+            # 复制原始mask图片及其元数据（旧版本的mask可能是jpg/gif，读取时会重新二值化）
+            new_mask = asset_store.path(new_md5, 'mask')
+            if mask_image.endswith('.png'):
+                shutil.copy2(mask_image, new_mask)
+            else:
+                Image.open(mask_image).save(new_mask, format='PNG')
+            asset_store.record(new_md5, 'mask')
+            mask_info = asset_store.find(md5, 'mask_info')
+            if mask_info:
+                shutil.copy2(mask_info, asset_store.path(new_md5, 'mask_info'))
+                asset_store.record(new_md5, 'mask_info')
             
-            # 生成缩略图
+            # new_md5 之前可能处理过，缓存中旧的mask和结果已与刚写入的文件不一致
+            image_cache.invalidate(new_md5, 'mask')
+            image_cache.invalidate(new_md5, 'lama')
+            # 新任务的原图和mask直接放入缓存，推理时无需重新解码
+            if output is not None:
+                image_cache.put(new_md5, 'image', output)
+            cached_mask = image_cache.get(md5, 'mask')
+            if cached_mask is not None:
+                image_cache.put(new_md5, 'mask', cached_mask)
+            
+            # 生成缩略图，结果缩略图已存在时直接复制
             try:
-                img = Image.open(new_image)
-                img.thumbnail((100, 100))
-                thumb_path = os.path.join(image_dir, f"{new_md5}_thumb.jpg")
-                img.save(thumb_path, "JPEG")
+                thumb_path = asset_store.path(new_md5, 'thumb')
+                lama_thumb = asset_store.find(md5, 'lama_thumb')
+                if lama_thumb:
+                    shutil.copy2(lama_thumb, thumb_path)
+                else:
+                    save_thumbnail(Image.open(new_image), thumb_path)
+                asset_store.record(new_md5, 'thumb')
             except Exception as e:
                 print(f"[WARNING] 生成缩略图失败: {str(e)}")
             
+            if self.restore_cached_result(new_md5):
+                return {
+                    'status': 'success',
+                    'message': '使用已缓存的处理结果',
+                    'new_md5': new_md5,
+                    'cached': True
+                }
+            
             # 添加到任务队列
-            if task_queue.add_task(new_md5):
+            if self.queue_inference(new_md5):
                 return {
                     'status': 'success',
                     'message': '已添加新的Lama任务',
@@ -282,52 +396,13 @@ class UploadHandler(BaseHTTPRequestHandler):
             }
 
     def parse_multipart(self):
+        """流式解析上传的表单，文件内容写入临时文件，超过大小限制时在读取过程中即抛出 UploadTooLarge"""
         content_type = self.headers.get('Content-Type')
         if not content_type:
             return None
         
         content_length = int(self.headers.get('Content-Length', 0))
-        
-        # 读取请求体
-        body = self.rfile.read(content_length)
-        
-        # 使用BytesParser解析multipart数据
-        parser = BytesParser()
-        headers = f"Content-Type: {content_type}\n\n".encode()
-        parsed = parser.parsebytes(headers + body)
-        
-        # 解析结果存储
-        form_data = {}
-        
-        if parsed.is_multipart():
-            for part in parsed.walk():
-                # 跳过主消息体
-                if part.get_content_maintype() == 'multipart':
-                    continue
-                    
-                # 获取字段名
-                disposition = part.get('Content-Disposition', '')
-                if not disposition:
-                    continue
-                    
-                # 解析Content-Disposition
-                disp_params = dict(param.strip().split('=', 1) for param in disposition.split(';')[1:] if '=' in param)
-                field_name = disp_params.get('name', '').strip('"')
-                
-                if 'filename' in disp_params:
-                    # 这是文件
-                    filename = disp_params['filename'].strip('"')
-                    content = part.get_payload(decode=True)
-                    form_data[field_name] = {
-                        'filename': filename,
-                        'content': content,
-                        'file': BytesIO(content)
-                    }
-                else:
-                    # 这是普通字段
-                    form_data[field_name] = part.get_payload()
-                    
-        return form_data
+        return parse_multipart(self.rfile, content_type, content_length, UPLOAD_MAX_SIZE)
 
     def handle_lama_request(self):
         """此注释保留!
@@ -354,27 +429,12 @@ class UploadHandler(BaseHTTPRequestHandler):
             
             md5 = data['md5']
             print(f"[DEBUG] 处理的MD5值: {md5}")
-            image_dir = 'image/'
             
             # 1. 查找原始图片
-            original_image = None
-            mask_image = None
-            for ext in ['jpg', 'png', 'gif']:
-                img_path = os.path.join(image_dir, f"{md5}.{ext}")
-                print(f"[DEBUG] 尝试查找原始图片: {img_path}")
-                if os.path.exists(img_path):
-                    original_image = img_path
-                    print(f"[DEBUG] 找到原始图片: {original_image}")
-                    break
+            original_image = asset_store.find(md5, 'original')
             
             # 2. 查找mask图片
-            for ext in ['png', 'jpg', 'gif']:
-                mask_path = os.path.join(image_dir, f"{md5}_mask.{ext}")
-                print(f"[DEBUG] 尝试查找mask图片: {mask_path}")
-                if os.path.exists(mask_path):
-                    mask_image = mask_path
-                    print(f"[DEBUG] 找到mask图片: {mask_image}")
-                    break
+            mask_image = asset_store.find(md5, 'mask')
             
             if not original_image or not mask_image:
                 print(f"[ERROR] 图片查找失败 - 原始图片: {original_image}, mask图片: {mask_image}")
@@ -383,8 +443,17 @@ class UploadHandler(BaseHTTPRequestHandler):
                     'message': '找不到原始图片或mask图片'
                 }
             
+            # 同一张图片配同一个mask已经处理过时直接完成任务，不再推理
+            if self.restore_cached_result(md5):
+                return {
+                    'status': 'success',
+                    'message': '使用已缓存的处理结果',
+                    'task_id': md5,
+                    'cached': True
+                }
+            
             # 添加到任务队列
-            if task_queue.add_task(md5):
+            if self.queue_inference(md5):
                 return {
                     'status': 'success',
                     'message': '任务已添加到队列',
@@ -448,23 +517,48 @@ class UploadHandler(BaseHTTPRequestHandler):
             return
 
         # 确保上传目录存在
-        upload_dir = 'image/'
+        upload_dir = asset_store.image_dir
         if not os.path.exists(upload_dir):
             os.makedirs(upload_dir, mode=0o777, exist_ok=True)
 
         # 解析表单数据
-        form = self.parse_multipart()
+        try:
+            form = self.parse_multipart()
+        except UploadTooLarge:
+            # 请求体没有读完，不能再复用这个连接
+            self.close_connection = True
+            response = {
+                'status': 'error',
+                'message': f'文件大小不能超过 {UPLOAD_MAX_SIZE // (1024 * 1024)}MB'
+            }
+            self.wfile.write(json.dumps(response).encode())
+            return
+        except MultipartError as e:
+            self.close_connection = True
+            response = {
+                'status': 'error',
+                'message': f'表单解析失败: {str(e)}'
+            }
+            self.wfile.write(json.dumps(response).encode())
+            return
 
-        response = {}
+        try:
+            response = self.handle_upload(form or {})
+        finally:
+            for value in (form or {}).values():
+                if isinstance(value, dict):
+                    value['file'].close()
+        self.wfile.write(json.dumps(response).encode())
 
+    def handle_upload(self, form):
+        """处理上传的图片或mask，返回响应内容"""
         # 检查是否有文件上传
         if 'file' not in form:
             response = {
                 'status': 'error',
                 'message': '没有接收到文件'
             }
-            self.wfile.write(json.dumps(response).encode())
-            return
+            return response
 
         # 检查是否提供了MD5值
         if 'md5' not in form:
@@ -472,23 +566,14 @@ class UploadHandler(BaseHTTPRequestHandler):
                 'status': 'error',
                 'message': '没有提供MD5值'
             }
-            self.wfile.write(json.dumps(response).encode())
-            return
+            return response
 
         file_item = form['file']
         md5 = form['md5']
 
-        # 检查文件大小（限制为 10MB）
-        if len(file_item['content']) > 10 * 1024 * 1024:
-            response = {
-                'status': 'error',
-                'message': '文件大小不能超过 10MB'
-            }
-            self.wfile.write(json.dumps(response).encode())
-            return
-        
-        # 读取文件头部来判断文件类型
-        header = file_item['content'][:8]
+        # 读取文件头部来判断文件类型（大小已在解析表单时检查）
+        header = file_item['file'].read(8)
+        file_item['file'].seek(0)
         
         # 检查文件类型
         is_valid_image = False
@@ -510,45 +595,63 @@ class UploadHandler(BaseHTTPRequestHandler):
                 'status': 'error',
                 'message': '只允许上传 JPG、PNG 或 GIF 格式的图片'
             }
-            self.wfile.write(json.dumps(response).encode())
-            return
+            return response
 
         # 检查是否是mask文件
         is_mask = 'mask' in file_item['filename'].lower()
         
-        # 设置文件名
-        file_name = f"{md5}{'_mask' if is_mask else ''}.{extension}"
-        target_path = os.path.join(upload_dir, file_name)
-
-        # 如果文件已存在，删除旧文件
-        if os.path.exists(target_path):
-            os.remove(target_path)
+        if not is_mask:
+            # 原图以内容MD5命名，校验提供的MD5与实际收到的内容一致
+            if file_item['md5'] != md5.strip().lower():
+                response = {
+                    'status': 'error',
+                    'message': 'MD5校验失败：文件内容与提供的MD5不一致'
+                }
+                return response
+            
+            # 相同内容已经保存过，无需重新解码、压缩和生成缩略图
+            if self.image_exists(md5):
+                print(f"[DEBUG] 原图已存在，跳过处理: {md5}")
+                response = {
+                    'status': 'success',
+                    'message': '文件已存在',
+                    'file_path': asset_store.path(md5, 'original'),
+                    'md5': md5,
+                    'type': 'jpg',
+                    'exists': True
+                }
+                return response
+        
+        # 如果文件已存在，删除旧文件（包括旧版本保存的其他扩展名）
+        kind = 'mask' if is_mask else 'original'
+        asset_store.discard(md5, kind)
+        target_path = asset_store.path(md5, kind)
 
         try:
             # 如果是mask图片，需要进行二值化处理
             if is_mask:
                 print("[DEBUG] 处理mask图片...")
-                # 将二进制内容转换为PIL图像
-                img = Image.open(BytesIO(file_item['content'])).convert('L')
-                
-                # 进行二值化处理
-                img = img.point(lambda x: 0 if x < 127 else 255, '1')
-                
                 # 删除旧的lama结果图片（如果存在）
-                lama_result_path = os.path.join(upload_dir, f"{md5}_lama.jpg")
-                if os.path.exists(lama_result_path):
-                    try:
-                        os.remove(lama_result_path)
+                try:
+                    lama_result_path = asset_store.discard(md5, 'lama')
+                    if lama_result_path:
                         print(f"[DEBUG] 已删除旧的lama结果: {lama_result_path}")
-                    except Exception as e:
-                        print(f"[WARNING] 删除旧的lama结果失败: {str(e)}")
+                except Exception as e:
+                    print(f"[WARNING] 删除旧的lama结果失败: {str(e)}")
+                
+                image_cache.invalidate(md5, 'lama')
                 
-                # 保存处理后的图片，mask图片保持原格式
-                img.save(target_path, format=extension.upper())
+                # 二值化后统一保存为1位PNG，同时保存外接框、覆盖率等元数据供推理时直接使用
+                mask, mask_info = save_mask(Image.open(file_item['file']), target_path, asset_store.path(md5, 'mask_info'))
+                asset_store.record(md5, 'mask')
+                asset_store.record(md5, 'mask_info')
+                image_cache.put(md5, 'mask', np.asarray(mask))
+                extension = 'png'
+                print(f"[DEBUG] mask已保存，外接框: {mask_info['bbox']}，覆盖率: {mask_info['coverage']:.2%}")
             else:
                 # 将原始图片转换为JPG格式
                 print("[DEBUG] 转换并保存原始图片...")
-                img = Image.open(BytesIO(file_item['content']))
+                img = Image.open(file_item['file'])
                 if img.mode in ('RGBA', 'LA'):
                     # 如果图片有透明通道，将其转换为RGB
                     background = Image.new('RGB', img.size, (255, 255, 255))
@@ -560,41 +663,19 @@ class UploadHandler(BaseHTTPRequestHandler):
                 elif img.mode != 'RGB':
                     img = img.convert('RGB')
                     
-                # 修改目标路径为jpg扩展名
-                target_path = os.path.join(upload_dir, f"{md5}.jpg")
-                
-                # 保存图片并检查文件大小
-                quality = 95
-                temp_buffer = BytesIO()
-                try:
-                    while True:
-                        # 重置缓冲区位置
-                        temp_buffer.seek(0)
-                        temp_buffer.truncate()
-                        
-                        # 保存到临时缓冲区以检查大小
-                        img.save(temp_buffer, format='JPEG', quality=quality)
-                        file_size = temp_buffer.tell()
-                        
-                        # 如果文件小于500KB或质量已经很低，则保存文件
-                        if file_size <= 500 * 1024 or quality <= 30:
-                            img.save(target_path, format='JPEG', quality=quality)
-                            print(f"[DEBUG] 图片已保存，质量：{quality}，大小：{file_size/1024:.1f}KB")
-                            break
-                        
-                        # 否则降低质量继续尝试
-                        quality -= 5
-                        print(f"[DEBUG] 文件过大 ({file_size/1024:.1f}KB)，降低质量到：{quality}")
-                finally:
-                    temp_buffer.close()
+                # 保存图片，控制文件大小不超过500KB
+                info = save_jpeg(img, target_path)
+                asset_store.record(md5, 'original', size=info['size'])
+                # 缓存解码后的数组，推理时无需再解码刚保存的JPEG
+                image_cache.put(md5, 'image', np.array(img))
                 
                 # 生成缩略图
                 try:
                     print("[DEBUG] 生成缩略图...")
                     # 使用thumbnail方法，自动保持纵横比
-                    img.thumbnail((80, 80), Image.Resampling.LANCZOS)
-                    thumb_path = os.path.join(upload_dir, f"{md5}_thumb.jpg")
-                    img.save(thumb_path, format='JPEG', quality=60)
+                    thumb_path = asset_store.path(md5, 'thumb')
+                    save_thumbnail(img, thumb_path)
+                    asset_store.record(md5, 'thumb')
                     print(f"[DEBUG] 缩略图已保存: {thumb_path}")
                 except Exception as e:
                     print(f"[WARNING] 生成缩略图失败: {str(e)}")
@@ -604,7 +685,7 @@ class UploadHandler(BaseHTTPRequestHandler):
                 'message': '文件上传成功',
                 'file_path': target_path,
                 'md5': md5,
-                'type': 'jpg' if not is_mask else extension  # mask保持原格式，其他都是jpg
+                'type': 'jpg' if not is_mask else extension  # mask统一为png，其他都是jpg
             }
         except Exception as e:
             print(f"[ERROR] 文件上传失败: {str(e)}")
@@ -615,17 +696,39 @@ class UploadHandler(BaseHTTPRequestHandler):
                 'message': f'文件上传失败: {str(e)}'
             }
 
-        self.wfile.write(json.dumps(response).encode())
-
-def run(server_class=HTTPServer, handler_class=UploadHandler, port=8080):
+        return response
+
+def start_inference():
+    """按 LAMA_STARTUP 启动推理worker
+    background：立即返回，模型在worker中后台加载，加载期间 /ready 返回503；
+    eager：等待模型加载完成；lazy：有待处理任务（如重启前未完成的任务）时才启动
+    """
+    if LAMA_STARTUP == 'lazy' and get_task_queue().get_next_pending_task() is None:
+        print("[INFO] 推理worker将在第一次有待处理任务时启动")
+        return
+    pool = lama_worker.start_workers()
+    if LAMA_STARTUP == 'eager':
+        print("[INFO] 等待模型加载完成...")
+        pool.wait_ready()
+
+def run(server_class=None, handler_class=UploadHandler, port=8080):
     server_address = ('', port)
-    httpd = server_class(server_address, handler_class)
+    if server_class is None:
+        httpd = create_server(server_address, handler_class)
+    else:
+        httpd = server_class(server_address, handler_class)
+    # 导入模块时不创建全局实例，在开始服务前打开任务存储并扫描缓存目录，避免第一个请求承担这部分开销
+    get_task_queue()
+    get_result_cache()
+    get_rendition_cache()
+    start_inference()
     print(f'Starting server on http://localhost:{port} ...')
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("Shutting down server...")
     finally:
+        get_task_queue().wake_waiters()
         httpd.server_close()
 
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class SharedArray:
+	"""保存在共享内存中的NumPy数组，用于在主进程和推理子进程之间传递图片而不经过管道序列化
+	创建方负责释放（unlink）共享内存，其他进程通过 spec 按名称附加，得到的数组直接映射同一块内存
+	"""
+
+	def __init__(self, shm, shape, dtype, owner):
+		self.shm = shm
+		self.shape = tuple(shape)
+		self.dtype = np.dtype(dtype)
+		self.owner = owner
+
+	@classmethod
+	def create(cls, shape, dtype):
+		"""分配一块未初始化的共享内存数组"""
+		nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+		shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+		return cls(shm, shape, dtype, owner=True)
+
+	@classmethod
+	def copy_of(cls, array):
+		"""把数组复制到新分配的共享内存中"""
+		shared = cls.create(array.shape, array.dtype)
+		shared.array[...] = array
+		return shared
+
+	@classmethod
+	def attach(cls, spec):
+		"""按 spec 附加到其他进程创建的共享内存"""
+		name, shape, dtype = spec
+		return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+	@property
+	def spec(self):
+		"""可以通过队列发送给其他进程的描述 (名称, 形状, 类型)"""
+		return self.shm.name, self.shape, self.dtype.str
+
+	@property
+	def array(self):
+		"""直接映射共享内存的数组视图，不复制数据"""
+		return np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+	def close(self):
+		"""解除映射，创建方同时释放共享内存
+		仍有数组视图引用这块内存时无法立即解除映射，留给垃圾回收处理
+		"""
+		try:
+			self.shm.close()
+		except BufferError:
+			pass
+		if self.owner:
+			try:
+				self.shm.unlink()
+			except FileNotFoundError:
+				pass
+			self.owner = False
@@ -1,101 +1,212 @@
-import json
-import os
 import time
-from threading import Lock
+from bisect import bisect_left, insort
+from collections import deque, OrderedDict
+from threading import Lock, Condition
+from task_storage import create_storage
+from image_cache import image_cache
+from asset_store import asset_store
+from config import TASK_WAIT_TIMEOUT, TASK_WAIT_MAX_WAITERS
 
 class TaskQueue:
 	def __init__(self):
-		self.queue_file = 'tasks.json'
+		self.storage = create_storage()
 		self.lock = Lock()
+		# add_task 时唤醒等待任务的worker
+		self.task_available = Condition(self.lock)
+		# 待处理任务的FIFO队列，元素为 (md5, create_time)；
+		# 元素可能已失效（任务被删除、重新添加或已被领取），出队时跳过
+		self.pending = deque()
+		# 按创建时间升序排列的 (create_time, md5) 索引，用于分页和清理旧任务
+		self.order = []
 		self.max_tasks = 1000  # 最大保存1000个任务
+		# 任务变化版本号，每次修改任务时加一并记录到该任务的 version 字段；
+		# 以启动时间（毫秒）和已保存任务的最大版本中的较大者为初值（见 _load_tasks）。
+		# 版本本身不保存，重启后仍可能小于客户端已知的版本，客户端传入的 since 大于当前版本时视为服务已重置
+		self.version = int(time.time() * 1000)
+		# 任务变化时唤醒等待变化的长轮询请求
+		self.task_changed = Condition(self.lock)
+		self.waiters = 0
+		# 服务关闭后长轮询不再等待
+		self.closing = False
+		# 已删除任务的墓碑 {md5: 删除时的版本}，增量查询据此返回被删除的任务；
+		# 最多保留 max_tasks 个，早于 tombstone_floor 的删除已无记录，此时只能返回完整列表
+		self.tombstones = OrderedDict()
 		self._load_tasks()
+		self.tombstone_floor = self.version
 	
 	def _load_tasks(self):
-		"""从文件加载任务列表"""
-		try:
-			if os.path.exists(self.queue_file):
-				with open(self.queue_file, 'r') as f:
-					self.tasks = json.load(f)
-			else:
-				self.tasks = {}
-		except Exception:
-			self.tasks = {}
-	
-	def _save_tasks(self):
-		"""保存任务列表到文件"""
-		with open(self.queue_file, 'w') as f:
-			json.dump(self.tasks, f, indent=2)
+		"""从存储加载任务列表"""
+		self.tasks = self.storage.load()
+		for task in self.tasks.values():
+			# 旧数据把错误堆栈直接拼在 message 中，拆到 detail 字段
+			if task['status'] == 'error' and '\n' in task.get('message', '') and 'detail' not in task:
+				task['message'], task['detail'] = task['message'].split('\n', 1)
+		self.version = max([self.version] + [task.get('version', 0) for task in self.tasks.values()])
+		self.order = sorted((task['create_time'], md5) for md5, task in self.tasks.items())
+		self.pending = deque(
+			(md5, create_time) for create_time, md5 in self.order if self.tasks[md5]['status'] == 'pending'
+		)
+	
+	def _save_tasks(self, changed=(), deleted=()):
+		"""保存任务变化
+		:param changed: 新增或修改的任务md5
+		:param deleted: 已删除的任务md5
+		"""
+		self.storage.save(self.tasks, changed, deleted)
 	
 	def _cleanup_old_tasks(self):
-		"""清理旧任务，保持任务数量在限制内"""
-		if len(self.tasks) > self.max_tasks:
-			# 按创建时间排序
-			sorted_tasks = sorted(self.tasks.items(), key=lambda x: x[1]['create_time'])
-			# 删除最老的任务，直到数量符合限制
-			while len(self.tasks) > self.max_tasks:
-				oldest_md5 = sorted_tasks[0][0]
-				del self.tasks[oldest_md5]
-				sorted_tasks.pop(0)
-				print(f"[INFO] 删除最老的任务: {oldest_md5}")
-	
-	def add_task(self, md5):
-		"""添加新任务"""
+		"""清理旧任务，保持任务数量在限制内
+		:return: 被删除的任务md5列表
+		"""
+		excess = len(self.tasks) - self.max_tasks
+		if excess <= 0:
+			return []
+		
+		# 索引头部就是最老的任务，一次性切掉
+		removed = [md5 for _, md5 in self.order[:excess]]
+		del self.order[:excess]
+		for oldest_md5 in removed:
+			del self.tasks[oldest_md5]
+			print(f"[INFO] 删除最老的任务: {oldest_md5}")
+		return removed
+	
+	def _mark_changed(self, *md5s, deleted=()):
+		"""记录任务变化并唤醒等待变化的请求，需在持有锁时调用
+		:param deleted: 被删除的任务md5，记录墓碑
+		"""
+		self.version += 1
+		for md5 in md5s:
+			self.tombstones.pop(md5, None)
+			if md5 in self.tasks:
+				self.tasks[md5]['version'] = self.version
+		for md5 in deleted:
+			self.tombstones.pop(md5, None)
+			self.tombstones[md5] = self.version
+		while len(self.tombstones) > self.max_tasks:
+			_, self.tombstone_floor = self.tombstones.popitem(last=False)
+		self.task_changed.notify_all()
+	
+	def _remove_from_order(self, md5):
+		"""从创建时间索引中移除任务，需在持有锁时调用"""
+		key = (self.tasks[md5]['create_time'], md5)
+		idx = bisect_left(self.order, key)
+		if idx < len(self.order) and self.order[idx] == key:
+			del self.order[idx]
+	
+	def add_task(self, md5, completed=False):
+		"""添加新任务
+		:param completed: 结果已经存在（如命中推理结果缓存）时直接添加为已完成的任务，不进入待处理队列
+		"""
 		with self.lock:
 			# 如果任务已存在，先删除旧任务
 			if md5 in self.tasks:
 				print(f"[INFO] 删除已存在的任务: {md5}")
+				self._remove_from_order(md5)
 				del self.tasks[md5]
 			
+			now = time.time()
 			self.tasks[md5] = {
-				'status': 'pending',  # pending, processing, completed, error
-				'create_time': time.time(),
-				'start_time': None,
-				'end_time': None,
-				'progress': 0,
-				'message': '等待处理'
+				'status': 'completed' if completed else 'pending',  # pending, processing, completed, error
+				'create_time': now,
+				'start_time': now if completed else None,
+				'end_time': now if completed else None,
+				'progress': 100 if completed else 0,
+				'message': '处理完成（使用缓存结果）' if completed else '等待处理'
 			}
-			self._cleanup_old_tasks()  # 检查并清理旧任务
-			self._save_tasks()
+			insort(self.order, (self.tasks[md5]['create_time'], md5))
+			removed = self._cleanup_old_tasks()  # 检查并清理旧任务
+			self._mark_changed(md5, deleted=removed)
+			self._save_tasks(changed=[md5], deleted=removed)
+			if not completed:
+				self.pending.append((md5, self.tasks[md5]['create_time']))
+				self.task_available.notify()
 			return True
 	
-	def get_task_status(self, md5=None, page=1, per_page=5):
+	@staticmethod
+	def _summary(task):
+		"""列表和轮询返回的任务信息，不含错误堆栈等详细信息，需在持有锁时调用
+		返回副本，调用方在锁外序列化时任务可能正被其他线程修改
+		"""
+		if task is None:
+			return None
+		return {key: value for key, value in task.items() if key != 'detail'}
+	
+	def _page(self, page, per_page, after):
+		"""分页信息和当前页任务的md5（按创建时间倒序），需在持有锁时调用"""
+		# 索引按创建时间升序，从尾部往前取即为倒序分页
+		if after is not None:
+			end_idx = bisect_left(self.order, (after,))
+		else:
+			end_idx = len(self.order) - (page - 1) * per_page
+		start_idx = max(0, end_idx - per_page)
+		page_keys = self.order[start_idx:max(0, end_idx)][::-1]
+		return [key_md5 for _, key_md5 in page_keys], {
+			'total': len(self.tasks),
+			'page': page,
+			'per_page': per_page,
+			'total_pages': (len(self.tasks) + per_page - 1) // per_page,
+			'next_after': page_keys[-1][0] if page_keys and start_idx > 0 else None,
+			'version': self.version
+		}
+	
+	def get_task_status(self, md5=None, page=1, per_page=5, after=None):
 		"""获取任务状态，支持分页
 		:param md5: 具体任务的md5，如果为None则返回分页列表
 		:param page: 页码，从1开始
 		:param per_page: 每页数量
-		:return: 任务状态或分页列表
+		:param after: 游标分页，返回创建时间早于该值的下一页，传入上一页返回的 next_after
+		:return: 任务状态或分页列表，错误堆栈通过 get_task_detail 获取
 		"""
 		with self.lock:
 			if md5 is not None:
-				return self.tasks.get(md5)
+				return self._summary(self.tasks.get(md5))
 			
-			# 按创建时间倒序排序
-			sorted_tasks = sorted(
-				self.tasks.items(),
-				key=lambda x: x[1]['create_time'],
-				reverse=True
-			)
-			
-			# 计算分页
-			start_idx = (page - 1) * per_page
-			end_idx = start_idx + per_page
-			page_tasks = sorted_tasks[start_idx:end_idx]
+			page_md5s, result = self._page(page, per_page, after)
+			result['tasks'] = {key_md5: self._summary(self.tasks[key_md5]) for key_md5 in page_md5s}
+			return result
+	
+	def get_changes(self, since, page=1, per_page=5, after=None):
+		"""增量查询：返回版本 since 之后的变化
+		:return: 没有变化时返回None；since 早于墓碑记录的范围或大于当前版本（服务重启后）时返回完整的分页列表（full 为True）；
+			否则 tasks 只包含当前页中变化过的任务，order 为当前页任务的md5顺序，deleted 为 since 之后删除的任务
+		"""
+		with self.lock:
+			if since == self.version:
+				return None
 			
-			# 转换为字典格式返回
-			return {
-				'tasks': dict(page_tasks),
-				'total': len(self.tasks),
-				'page': page,
-				'per_page': per_page,
-				'total_pages': (len(self.tasks) + per_page - 1) // per_page
+			page_md5s, result = self._page(page, per_page, after)
+			full = since < self.tombstone_floor or since > self.version
+			result['full'] = full
+			result['tasks'] = {
+				key_md5: self._summary(self.tasks[key_md5]) for key_md5 in page_md5s
+				if full or self.tasks[key_md5].get('version', 0) > since
 			}
+			if not full:
+				result['order'] = page_md5s
+				result['deleted'] = [md5 for md5, version in self.tombstones.items() if version > since]
+			return result
 	
-	def update_task_status(self, md5, status, message='', progress=None):
-		"""更新任务状态"""
+	def get_task_detail(self, md5):
+		"""获取任务的完整信息，包括失败时的错误堆栈"""
+		with self.lock:
+			task = self.tasks.get(md5)
+			return dict(task) if task is not None else None
+	
+	def update_task_status(self, md5, status, message='', progress=None, detail=None):
+		"""更新任务状态
+		:param detail: 详细信息（如错误堆栈），只通过 get_task_detail 返回
+		"""
 		with self.lock:
 			if md5 in self.tasks:
+				if status == 'pending' and self.tasks[md5]['status'] != 'pending':
+					self.pending.append((md5, self.tasks[md5]['create_time']))
+					self.task_available.notify()
 				self.tasks[md5]['status'] = status
 				self.tasks[md5]['message'] = message
+				if detail:
+					self.tasks[md5]['detail'] = detail
+				else:
+					self.tasks[md5].pop('detail', None)
 				
 				if progress is not None:
 					self.tasks[md5]['progress'] = progress
@@ -105,17 +216,102 @@ class TaskQueue:
 				elif status in ['completed', 'error']:
 					self.tasks[md5]['end_time'] = time.time()
 				
-				self._save_tasks()
+				self._mark_changed(md5)
+				self._save_tasks(changed=[md5])
 				return True
 			return False
 	
-	def get_next_pending_task(self):
-		"""获取下一个待处理的任务"""
+	def _pop_stale_pending(self):
+		"""丢弃队首已失效的条目，需在持有锁时调用"""
+		while self.pending:
+			md5, create_time = self.pending[0]
+			task = self.tasks.get(md5)
+			if task is not None and task['status'] == 'pending' and task['create_time'] == create_time:
+				return
+			self.pending.popleft()
+	
+	def get_next_pending_task(self, timeout=0):
+		"""获取下一个待处理的任务（不领取）
+		:param timeout: 没有待处理任务时最多等待的秒数
+		"""
+		deadline = time.monotonic() + timeout
 		with self.lock:
-			for md5, task in self.tasks.items():
-				if task['status'] == 'pending':
+			while True:
+				self._pop_stale_pending()
+				if self.pending:
+					if timeout:
+						# 可能消耗了 add_task 发给领取任务的worker的通知，任务并未被领取，把通知传下去
+						self.task_available.notify()
+					return self.pending[0][0]
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					return None
+				self.task_available.wait(remaining)
+	
+	def claim_next_task(self, timeout=0, expected=None):
+		"""原子地取出下一个待处理任务并标记为处理中，多个worker并发调用时同一任务只会被取出一次
+		:param timeout: 没有待处理任务时最多等待的秒数，add_task 会立即唤醒等待者
+		:param expected: 只在下一个待处理任务是该md5时才领取（先用 get_next_pending_task 查看再决定是否领取）
+		:return: 任务md5，超时仍没有待处理任务时返回None
+		"""
+		deadline = time.monotonic() + timeout
+		with self.lock:
+			while True:
+				self._pop_stale_pending()
+				if self.pending and expected is not None and self.pending[0][0] != expected:
+					return None
+				if self.pending:
+					md5, _ = self.pending.popleft()
+					task = self.tasks[md5]
+					task['status'] = 'processing'
+					task['message'] = '等待推理'
+					task['start_time'] = time.time()
+					self._mark_changed(md5)
+					self._save_tasks(changed=[md5])
 					return md5
-			return None
+				
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					return None
+				self.task_available.wait(remaining)
+	
+	def _version_of(self, md5):
+		"""全局版本，或指定任务的版本（任务不存在时为全局版本），需在持有锁时调用"""
+		if md5 is not None and md5 in self.tasks:
+			return self.tasks[md5].get('version', 0)
+		return self.version
+	
+	def wait_for_change(self, since, md5=None, timeout=TASK_WAIT_TIMEOUT):
+		"""长轮询：等待任务在版本 since 之后发生变化，有变化时立即返回
+		同时等待的请求数超过 TASK_WAIT_MAX_WAITERS 时不等待，避免长轮询占满HTTP线程池
+		:param md5: 只等待指定任务的变化，为None时等待任意任务的变化
+		:return: (当前版本, 是否因等待数已满而未等待)；当前版本与 since 不同即表示有变化
+		"""
+		deadline = time.monotonic() + timeout
+		with self.lock:
+			current = self._version_of(md5)
+			# since 大于全局版本说明服务已重启，客户端需要立即重新查询
+			if current > since or since > self.version or self.closing:
+				return current, False
+			if self.waiters >= TASK_WAIT_MAX_WAITERS:
+				return current, True
+			self.waiters += 1
+			try:
+				while current <= since and not self.closing:
+					remaining = deadline - time.monotonic()
+					if remaining <= 0:
+						break
+					self.task_changed.wait(remaining)
+					current = self._version_of(md5)
+			finally:
+				self.waiters -= 1
+			return current, False
+	
+	def wake_waiters(self):
+		"""服务关闭时唤醒所有长轮询请求并让它们立即返回"""
+		with self.lock:
+			self.closing = True
+			self.task_changed.notify_all()
 	
 	def delete_task(self, md5):
 		"""删除指定的任务及其相关文件
@@ -137,27 +333,14 @@ class TaskQueue:
 				}
 			
 			# 删除任务数据
+			self._remove_from_order(md5)
 			del self.tasks[md5]
-			self._save_tasks()
+			self._mark_changed(deleted=[md5])
+			self._save_tasks(deleted=[md5])
+			image_cache.invalidate(md5)
 			
 			# 删除相关图片文件
-			image_dir = 'image/'
-			files_to_delete = [
-				f"{md5}.jpg", f"{md5}.png", f"{md5}.gif",
-				f"{md5}_thumb.jpg", f"{md5}_thumb.png", f"{md5}_thumb.gif",
-				f"{md5}_mask.jpg", f"{md5}_mask.png", f"{md5}_mask.gif",
-				f"{md5}_lama.jpg", f"{md5}_lama_thumb.jpg"
-			]
-			
-			deleted_files = []
-			for filename in files_to_delete:
-				file_path = os.path.join(image_dir, filename)
-				if os.path.exists(file_path):
-					try:
-						os.remove(file_path)
-						deleted_files.append(filename)
-					except Exception as e:
-						print(f"[WARNING] 删除文件 {filename} 失败: {str(e)}")
+			deleted_files = asset_store.delete(md5)
 			
 			return {
 				'status': 'success',
@@ -165,5 +348,15 @@ class TaskQueue:
 				'deleted_files': deleted_files
 			}
 
-# 创建全局任务队列实例
-task_queue = TaskQueue() 
+# 全局任务队列实例，由 get_task_queue 在第一次使用时创建，导入本模块不会打开任务存储
+_task_queue = None
+_task_queue_lock = Lock()
+
+def get_task_queue():
+	"""获取全局任务队列实例，第一次调用时打开任务存储（必要时从tasks.json迁移）并加载全部任务"""
+	global _task_queue
+	with _task_queue_lock:
+		if _task_queue is None:
+			_task_queue = TaskQueue()
+		return _task_queue
+
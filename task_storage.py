@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+from threading import Lock
+from config import TASK_STORAGE, TASK_JSON_FILE, TASK_DB_FILE
+
+
+class JsonTaskStorage:
+	"""把全部任务保存在一个JSON文件中（旧格式），每次修改都整体重写"""
+
+	def __init__(self, path=TASK_JSON_FILE):
+		self.path = path
+
+	def load(self):
+		"""读取全部任务
+		:return: {md5: task}
+		"""
+		try:
+			if os.path.exists(self.path):
+				with open(self.path, 'r') as f:
+					return json.load(f)
+		except Exception as e:
+			print(f"[WARNING] 读取任务文件失败: {str(e)}")
+		return {}
+
+	def save(self, tasks, changed=(), deleted=()):
+		"""保存任务列表，先写临时文件再原子替换，写入中途崩溃不会损坏原文件"""
+		temp_path = self.path + '.tmp'
+		with open(temp_path, 'w') as f:
+			json.dump(tasks, f, indent=2)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(temp_path, self.path)
+
+
+class SqliteTaskStorage:
+	"""SQLite(WAL)存储，每次修改只写入变化的行"""
+
+	def __init__(self, path=TASK_DB_FILE, json_path=TASK_JSON_FILE):
+		self.path = path
+		self.json_path = json_path
+		self.lock = Lock()
+		self.conn = sqlite3.connect(path, check_same_thread=False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		# WAL模式下 NORMAL 同步级别即可保证崩溃后数据库一致
+		self.conn.execute('PRAGMA synchronous=NORMAL')
+		with self.conn:
+			self.conn.execute('''
+				CREATE TABLE IF NOT EXISTS tasks (
+					md5 TEXT PRIMARY KEY,
+					status TEXT NOT NULL,
+					create_time REAL NOT NULL,
+					data TEXT NOT NULL
+				)
+			''')
+			self.conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_create_time ON tasks(create_time)')
+			self.conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)')
+
+	def load(self):
+		"""读取全部任务，数据库为空且存在旧的tasks.json时先执行一次迁移
+		:return: {md5: task}
+		"""
+		with self.lock:
+			count = self.conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+		if count == 0 and self.json_path and os.path.exists(self.json_path):
+			self.migrate_from_json(self.json_path)
+
+		with self.lock:
+			rows = self.conn.execute('SELECT md5, data FROM tasks ORDER BY create_time').fetchall()
+		return {md5: json.loads(data) for md5, data in rows}
+
+	def save(self, tasks, changed=(), deleted=()):
+		"""在一个事务中写入变化的任务并删除已删除的任务"""
+		rows = [
+			(md5, tasks[md5]['status'], tasks[md5]['create_time'], json.dumps(tasks[md5]))
+			for md5 in changed if md5 in tasks
+		]
+		with self.lock, self.conn:
+			if deleted:
+				self.conn.executemany('DELETE FROM tasks WHERE md5 = ?', [(md5,) for md5 in deleted])
+			if rows:
+				self.conn.executemany(
+					'INSERT OR REPLACE INTO tasks (md5, status, create_time, data) VALUES (?, ?, ?, ?)',
+					rows
+				)
+
+	def migrate_from_json(self, json_path):
+		"""把旧的tasks.json导入数据库，完成后重命名为 tasks.json.migrated
+		:return: 导入的任务数量
+		"""
+		tasks = JsonTaskStorage(json_path).load()
+		self.save(tasks, changed=list(tasks))
+		os.replace(json_path, json_path + '.migrated')
+		print(f"[INFO] 已从 {json_path} 迁移 {len(tasks)} 个任务到 {self.path}")
+		return len(tasks)
+
+
+def create_storage(backend=TASK_STORAGE):
+	"""按配置创建任务存储
+	:param backend: sqlite / json
+	"""
+	if backend == 'json':
+		return JsonTaskStorage()
+	return SqliteTaskStorage()
@@ -0,0 +1,83 @@
+"""整图模式（full）推理结果的尺寸必须与原图一致
+
+用法（在项目根目录执行）：
+	python -m unittest discover tests
+
+模型用恒等函数代替，不需要torch和模型文件；进程模式按推理子进程的方式把结果写入按原图尺寸分配的共享内存。
+"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+	import numpy as np
+	import PIL  # noqa: F401
+except ImportError:
+	np = None
+
+
+def make_worker(finisher):
+	"""创建不加载模型的worker，模型推理直接返回输入图片"""
+	from inpaint import LamaInpainter
+	from lama_worker import LamaWorker
+	worker = LamaWorker(name='test', reporter=lambda *args, **kwargs: None, finisher=finisher, autostart=False)
+	worker.inpainter = LamaInpainter(None, 'cpu')
+	worker.inpainter.run_model = lambda image, mask: image.copy()
+	return worker
+
+
+def make_job(md5, h, w):
+	image = np.random.default_rng(0).integers(0, 256, (h, w, 3), dtype=np.uint8)
+	mask = np.zeros((h, w), dtype=np.float32)
+	mask[h // 4:h // 2, w // 4:w // 2] = 1
+	return {'md5': md5, 'image': image, 'mask': mask, 'bbox': None, 'mask_hash': None}
+
+
+@unittest.skipIf(np is None, '需要 numpy 和 Pillow')
+class FullModeShapeTest(unittest.TestCase):
+	SHAPE = (75, 101)  # 高、宽都不是8的倍数
+
+	def setUp(self):
+		import lama_worker
+		self.lama_worker = lama_worker
+		self.saved_mode = lama_worker.LAMA_INFERENCE_MODE
+		lama_worker.LAMA_INFERENCE_MODE = 'full'
+
+	def tearDown(self):
+		self.lama_worker.LAMA_INFERENCE_MODE = self.saved_mode
+
+	def test_thread_mode(self):
+		results = {}
+		worker = make_worker(lambda md5, output, mask_hash=None: results.__setitem__(md5, output))
+		worker.run_jobs([make_job('a', *self.SHAPE)])
+		self.assertEqual(results['a'].shape, self.SHAPE + (3,))
+		self.assertEqual(results['a'].dtype, np.uint8)
+
+	def test_process_mode(self):
+		from shared_arrays import SharedArray
+		job = make_job('a', *self.SHAPE)
+		image, mask = SharedArray.copy_of(job['image']), SharedArray.copy_of(job['mask'])
+		# 与 LamaWorkerPool._share 一样按原图尺寸分配结果缓冲区
+		output = SharedArray.create(job['image'].shape, np.uint8)
+		finished = []
+
+		def finish(md5, result, mask_hash=None):
+			output.array[...] = result
+			finished.append(md5)
+
+		try:
+			job['image'], job['mask'] = image.array, mask.array
+			make_worker(finish).run_jobs([job])
+			self.assertEqual(finished, ['a'])
+			self.assertEqual(output.array.shape, self.SHAPE + (3,))
+		finally:
+			job.clear()
+			for array in (image, mask, output):
+				array.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+"""mask为空的任务再次Lama时，结果与原图相同，应直接返回“无需再次处理”而不是复制文件到自身
+
+用法（在项目根目录执行）：
+	python -m unittest discover tests
+
+图片写入临时目录，不需要torch和模型文件。
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+	import numpy as np
+	from PIL import Image
+except ImportError:
+	np = None
+
+
+@unittest.skipIf(np is None, '需要 numpy 和 Pillow')
+class EmptyMaskRelamaTest(unittest.TestCase):
+
+	def setUp(self):
+		from asset_store import asset_store
+		self.asset_store = asset_store
+		self.saved = (asset_store.image_dir, asset_store.assets, asset_store.extras, asset_store.shards)
+		self.tmp = tempfile.mkdtemp()
+		asset_store.image_dir = os.path.join(self.tmp, 'image')
+		asset_store.assets, asset_store.extras, asset_store.shards = {}, {}, set()
+
+	def tearDown(self):
+		store = self.asset_store
+		store.image_dir, store.assets, store.extras, store.shards = self.saved
+		shutil.rmtree(self.tmp, ignore_errors=True)
+
+	def save_task(self):
+		"""保存原图、缩略图和空mask，返回原图md5和路径"""
+		buffer = io.BytesIO()
+		Image.new('RGB', (64, 48), (200, 120, 40)).save(buffer, format='JPEG')
+		md5 = hashlib.md5(buffer.getvalue()).hexdigest()
+		store = self.asset_store
+		original = store.path(md5, 'original')
+		with open(original, 'wb') as f:
+			f.write(buffer.getvalue())
+		Image.open(original).save(store.path(md5, 'thumb'), format='JPEG')
+		Image.new('L', (64, 48), 0).save(store.path(md5, 'mask'), format='PNG')
+		for kind in ('original', 'thumb', 'mask'):
+			store.record(md5, kind)
+		return md5, original
+
+	def relama(self, md5):
+		from upload import UploadHandler
+		body = json.dumps({'md5': md5}).encode()
+		handler = object.__new__(UploadHandler)
+		handler.headers = {'Content-Length': str(len(body))}
+		handler.rfile = io.BytesIO(body)
+		return handler.handle_relama_request()
+
+	def test_relama_after_empty_mask(self):
+		from lama_worker import LamaWorker
+		md5, original = self.save_task()
+		statuses = []
+		worker = LamaWorker(name='test', reporter=lambda md5, status, *args, **kwargs: statuses.append(status), autostart=False)
+		worker._finish_empty({'md5': md5, 'original': original})
+		self.assertEqual(statuses, ['completed'])
+
+		response = self.relama(md5)
+		self.assertEqual(response['status'], 'success')
+		self.assertEqual(response['new_md5'], md5)
+		self.assertTrue(response['unchanged'])
+
+
+if __name__ == '__main__':
+	unittest.main()